@@ -9,10 +9,16 @@ n8n API Routes - Эндпоинты для интеграции с n8n.
 
 import hmac
 import hashlib
-from typing import Optional, List
-from datetime import datetime
-
-from fastapi import APIRouter, HTTPException, Header, Request, BackgroundTasks
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass
+from typing import Annotated, Optional, List, Tuple
+from datetime import datetime, timezone
+
+import aiohttp
+import msgspec
+import orjson
+from fastapi import APIRouter, HTTPException, Header, Request, Response, BackgroundTasks
+from fastapi.exceptions import RequestValidationError
 from pydantic import BaseModel, Field
 
 from app.services.n8n_service import (
@@ -20,12 +26,38 @@ from app.services.n8n_service import (
     WebhookEventType,
     N8nService
 )
+from app.services.cache_service import redis_memoize
+from app.utils.json_utils import parse_json
 from app.utils.logger import get_logger
+from config.settings import DEFAULT_N8N_WEBHOOK_SECRET, settings
 
 logger = get_logger(__name__)
 
 router = APIRouter(prefix="/api/v1/n8n", tags=["n8n"])
 
+# Общая HTTP сессия для callback-запросов (keep-alive, пул соединений)
+_http_session: Optional[aiohttp.ClientSession] = None
+
+# Ключ для проверки подписи команд от n8n (X-N8N-Signature)
+_N8N_SECRET = settings.n8n_webhook_secret.encode()
+_N8N_SECRET_IS_DEFAULT = settings.n8n_webhook_secret == DEFAULT_N8N_WEBHOOK_SECRET
+
+if settings.n8n_require_signature and _N8N_SECRET_IS_DEFAULT:
+    logger.error("N8N_WEBHOOK_SECRET не задан: команды от n8n будут отклоняться")
+
+# Список типов событий не меняется во время работы, сериализуем его один раз
+_EVENT_TYPES_BYTES = orjson.dumps(
+    {
+        "event_types": [
+            {"value": e.value, "name": e.name, "category": e.value.split(".", 1)[0]}
+            for e in WebhookEventType
+        ]
+    }
+)
+
+_VALID_EVENT_TYPES = tuple(e.value for e in WebhookEventType)
+_VALID_EVENT_TYPES_MSG = f"Valid types: {list(_VALID_EVENT_TYPES)}"
+
 
 # ============== Request/Response Models ==============
 
@@ -34,7 +66,7 @@ class WebhookRegistration(BaseModel):
     workflow_id: str = Field(..., description="ID workflow в n8n")
     name: str = Field(..., description="Название workflow")
     webhook_url: str = Field(..., description="URL webhook'а")
-    triggers: List[str] = Field(..., description="Типы событий для триггера")
+    triggers: List[WebhookEventType] = Field(..., description="Типы событий для триггера")
     description: str = Field("", description="Описание workflow")
 
 
@@ -48,13 +80,22 @@ class WebhookResponse(BaseModel):
     description: str
 
 
-class N8nCommand(BaseModel):
+class N8nCommand(msgspec.Struct):
     """Команда от n8n workflow."""
-    command: str = Field(..., description="Тип команды")
-    target: Optional[str] = Field(None, description="Цель команды")
-    parameters: dict = Field(default_factory=dict, description="Параметры команды")
-    workflow_id: Optional[str] = Field(None, description="ID workflow отправителя")
-    callback_url: Optional[str] = Field(None, description="URL для callback")
+    command: Annotated[str, msgspec.Meta(description="Тип команды")]
+    target: Annotated[Optional[str], msgspec.Meta(description="Цель команды")] = None
+    parameters: Annotated[dict, msgspec.Meta(description="Параметры команды")] = msgspec.field(default_factory=dict)
+    workflow_id: Annotated[Optional[str], msgspec.Meta(description="ID workflow отправителя")] = None
+    callback_url: Annotated[Optional[str], msgspec.Meta(description="URL для callback")] = None
+
+
+_CMD_DECODER = msgspec.json.Decoder(N8nCommand)
+_CMD_SCHEMA = msgspec.json.schema_components([N8nCommand])[1]["N8nCommand"]
+
+
+def _utc_timestamp() -> str:
+    """Текущее время UTC в ISO 8601 с миллисекундами."""
+    return datetime.now(timezone.utc).isoformat(timespec="milliseconds")
 
 
 class CommandResult(BaseModel):
@@ -63,7 +104,7 @@ class CommandResult(BaseModel):
     command: str
     message: str
     data: Optional[dict] = None
-    timestamp: str = Field(default_factory=lambda: datetime.utcnow().isoformat())
+    timestamp: str = Field(default_factory=_utc_timestamp)
 
 
 class EventPayload(BaseModel):
@@ -84,9 +125,24 @@ class HealthResponse(BaseModel):
 
 # ============== Webhook Endpoints ==============
 
-@router.post("/webhook/command", response_model=CommandResult)
+def _verify_sig(body: bytes, sig: Optional[str]) -> bool:
+    """Проверяет HMAC-SHA256 подпись тела запроса за постоянное время."""
+    expected = hmac.new(_N8N_SECRET, body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, sig or "")
+
+
+@router.post(
+    "/webhook/command",
+    response_model=CommandResult,
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {"application/json": {"schema": _CMD_SCHEMA}},
+        }
+    },
+)
 async def receive_command(
-    command: N8nCommand,
+    request: Request,
     background_tasks: BackgroundTasks,
     x_n8n_signature: Optional[str] = Header(None, alias="X-N8N-Signature")
 ):
@@ -102,32 +158,55 @@ async def receive_command(
     - block_ip: Блокировка IP адреса
     - send_notification: Отправка уведомления
     """
+    body = await request.body()
+
+    if settings.n8n_require_signature or x_n8n_signature:
+        if _N8N_SECRET_IS_DEFAULT:
+            logger.warning("Rejected n8n command: N8N_WEBHOOK_SECRET is not configured")
+            raise HTTPException(status_code=503, detail="Webhook secret is not configured")
+        if not _verify_sig(body, x_n8n_signature):
+            logger.warning("Rejected n8n command with invalid signature")
+            raise HTTPException(status_code=401, detail="Invalid signature")
+
+    try:
+        command = _CMD_DECODER.decode(body)
+    except msgspec.ValidationError as e:
+        raise RequestValidationError([{"loc": ("body",), "msg": str(e), "type": "value_error"}])
+    except msgspec.DecodeError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid JSON body: {e}")
+
     logger.info(f"Received command from n8n: {command.command}")
     
     # Обработка команды
-    handlers = {
-        "restart_service": _handle_restart_service,
-        "run_playbook": _handle_run_playbook,
-        "analyze_logs": _handle_analyze_logs,
-        "create_backup": _handle_create_backup,
-        "scale_service": _handle_scale_service,
-        "block_ip": _handle_block_ip,
-        "send_notification": _handle_send_notification,
-        "health_check": _handle_health_check,
-    }
+    spec = _COMMAND_HANDLERS.get(command.command)
+    
+    if not spec:
+        return Response(
+            content=orjson.dumps({
+                "success": False,
+                "command": command.command,
+                "message": f"Unknown command: {command.command}",
+                "data": _UNKNOWN_COMMAND_DATA,
+                "timestamp": _utc_timestamp(),
+            }),
+            media_type="application/json"
+        )
     
-    handler = handlers.get(command.command)
+    target = command.target
+    if not target and spec.target_param:
+        target = command.parameters.get(spec.target_param)
     
-    if not handler:
+    if (spec.required_target and not target) or any(
+        not command.parameters.get(p) for p in spec.required_params
+    ):
         return CommandResult(
             success=False,
             command=command.command,
-            message=f"Unknown command: {command.command}",
-            data={"available_commands": list(handlers.keys())}
+            message=spec.missing_message
         )
     
     try:
-        result = await handler(command.target, command.parameters)
+        result = await spec.handler(target, command.parameters)
         
         # Если есть callback URL, отправляем результат
         if command.callback_url:
@@ -160,7 +239,7 @@ async def receive_alert_from_n8n(
     (Zabbix, Nagios, CloudWatch и т.д.) в AIOps.
     """
     try:
-        body = await request.json()
+        body = await parse_json(request)
         
         alert_data = {
             "source": body.get("source", "n8n"),
@@ -199,23 +278,12 @@ async def register_webhook(registration: WebhookRegistration):
     """
     n8n_service = get_n8n_service()
     
-    # Валидация типов событий
-    valid_triggers = []
-    for trigger in registration.triggers:
-        try:
-            event_type = WebhookEventType(trigger)
-            valid_triggers.append(event_type)
-        except ValueError:
-            raise HTTPException(
-                status_code=400,
-                detail=f"Invalid trigger type: {trigger}. Valid types: {[e.value for e in WebhookEventType]}"
-            )
-    
+    # Типы событий уже провалидированы Pydantic при разборе запроса
     workflow = n8n_service.register_webhook(
         workflow_id=registration.workflow_id,
         name=registration.name,
         webhook_url=registration.webhook_url,
-        triggers=valid_triggers,
+        triggers=registration.triggers,
         description=registration.description
     )
     
@@ -246,7 +314,8 @@ async def list_webhooks():
     n8n_service = get_n8n_service()
     webhooks = n8n_service.get_registered_webhooks()
     
-    return [WebhookResponse(**w) for w in webhooks]
+    # Словари уже соответствуют WebhookResponse, модель нужна только для схемы OpenAPI
+    return Response(content=orjson.dumps(webhooks), media_type="application/json")
 
 
 @router.post("/events/send")
@@ -264,7 +333,7 @@ async def send_event(payload: EventPayload):
     except ValueError:
         raise HTTPException(
             status_code=400,
-            detail=f"Invalid event type: {payload.event_type}"
+            detail=f"Invalid event type: {payload.event_type}. {_VALID_EVENT_TYPES_MSG}"
         )
     
     result = await n8n_service.send_event(
@@ -278,6 +347,7 @@ async def send_event(payload: EventPayload):
 
 
 @router.get("/health", response_model=HealthResponse)
+@redis_memoize(ttl=5, key_prefix="status:v1")
 async def check_n8n_health():
     """Проверяет доступность n8n."""
     n8n_service = get_n8n_service()
@@ -289,29 +359,13 @@ async def check_n8n_health():
 @router.get("/event-types")
 async def list_event_types():
     """Возвращает список доступных типов событий."""
-    return {
-        "event_types": [
-            {
-                "value": e.value,
-                "name": e.name,
-                "category": e.value.split(".")[0]
-            }
-            for e in WebhookEventType
-        ]
-    }
+    return Response(content=_EVENT_TYPES_BYTES, media_type="application/json")
 
 
 # ============== Command Handlers ==============
 
 async def _handle_restart_service(target: Optional[str], params: dict) -> CommandResult:
     """Обработчик команды перезапуска сервиса."""
-    if not target:
-        return CommandResult(
-            success=False,
-            command="restart_service",
-            message="Target service not specified"
-        )
-    
     # Здесь должна быть логика перезапуска сервиса
     logger.info(f"Restarting service: {target}")
     
@@ -325,14 +379,7 @@ async def _handle_restart_service(target: Optional[str], params: dict) -> Comman
 
 async def _handle_run_playbook(target: Optional[str], params: dict) -> CommandResult:
     """Обработчик команды запуска плейбука."""
-    playbook = target or params.get("playbook")
-    
-    if not playbook:
-        return CommandResult(
-            success=False,
-            command="run_playbook",
-            message="Playbook name not specified"
-        )
+    playbook = target
     
     logger.info(f"Running playbook: {playbook}")
     
@@ -375,13 +422,6 @@ async def _handle_create_backup(target: Optional[str], params: dict) -> CommandR
 
 async def _handle_scale_service(target: Optional[str], params: dict) -> CommandResult:
     """Обработчик команды масштабирования сервиса."""
-    if not target:
-        return CommandResult(
-            success=False,
-            command="scale_service",
-            message="Target service not specified"
-        )
-    
     replicas = params.get("replicas", 1)
     
     logger.info(f"Scaling service {target} to {replicas} replicas")
@@ -396,15 +436,7 @@ async def _handle_scale_service(target: Optional[str], params: dict) -> CommandR
 
 async def _handle_block_ip(target: Optional[str], params: dict) -> CommandResult:
     """Обработчик команды блокировки IP."""
-    ip = target or params.get("ip")
-    
-    if not ip:
-        return CommandResult(
-            success=False,
-            command="block_ip",
-            message="IP address not specified"
-        )
-    
+    ip = target
     reason = params.get("reason", "Blocked via n8n automation")
     duration = params.get("duration", "24h")
     
@@ -421,14 +453,7 @@ async def _handle_block_ip(target: Optional[str], params: dict) -> CommandResult
 async def _handle_send_notification(target: Optional[str], params: dict) -> CommandResult:
     """Обработчик команды отправки уведомления."""
     channel = target or params.get("channel", "telegram")
-    message = params.get("message", "")
-    
-    if not message:
-        return CommandResult(
-            success=False,
-            command="send_notification",
-            message="Notification message not specified"
-        )
+    message = params["message"]
     
     logger.info(f"Sending notification to {channel}: {message[:50]}...")
     
@@ -463,18 +488,74 @@ async def _handle_health_check(target: Optional[str], params: dict) -> CommandRe
     )
 
 
+@dataclass(slots=True, frozen=True)
+class CmdSpec:
+    """Описание команды n8n: обработчик и обязательные аргументы."""
+    handler: Callable[[Optional[str], dict], Awaitable[CommandResult]]
+    required_target: bool = False
+    target_param: Optional[str] = None  # Параметр, подставляемый вместо пустого target
+    required_params: Tuple[str, ...] = ()
+    missing_message: str = ""
+
+
+# Таблица диспетчеризации команд n8n
+_COMMAND_HANDLERS = {
+    "restart_service": CmdSpec(
+        _handle_restart_service, required_target=True, missing_message="Target service not specified"
+    ),
+    "run_playbook": CmdSpec(
+        _handle_run_playbook, required_target=True, target_param="playbook",
+        missing_message="Playbook name not specified"
+    ),
+    "analyze_logs": CmdSpec(_handle_analyze_logs),
+    "create_backup": CmdSpec(_handle_create_backup),
+    "scale_service": CmdSpec(
+        _handle_scale_service, required_target=True, missing_message="Target service not specified"
+    ),
+    "block_ip": CmdSpec(
+        _handle_block_ip, required_target=True, target_param="ip", missing_message="IP address not specified"
+    ),
+    "send_notification": CmdSpec(
+        _handle_send_notification, required_params=("message",),
+        missing_message="Notification message not specified"
+    ),
+    "health_check": CmdSpec(_handle_health_check),
+}
+
+_AVAILABLE_COMMANDS = tuple(_COMMAND_HANDLERS)
+
+# Статическая часть ответа на неизвестную команду, сериализованная один раз
+_UNKNOWN_COMMAND_DATA = orjson.Fragment(orjson.dumps({"available_commands": _AVAILABLE_COMMANDS}))
+
+
+async def _get_http_session() -> aiohttp.ClientSession:
+    """Возвращает общую HTTP сессию для callback-запросов."""
+    global _http_session
+    if _http_session is None or _http_session.closed:
+        _http_session = aiohttp.ClientSession(
+            timeout=aiohttp.ClientTimeout(total=10),
+            connector=aiohttp.TCPConnector(limit=100, ttl_dns_cache=300, keepalive_timeout=60),
+        )
+    return _http_session
+
+
+@router.on_event("shutdown")
+async def _close_http_session():
+    """Закрывает общую HTTP сессию при остановке приложения."""
+    if _http_session and not _http_session.closed:
+        await _http_session.close()
+
+
 async def _send_callback(callback_url: str, result: CommandResult):
     """Отправляет результат на callback URL."""
-    import aiohttp
-    
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                callback_url,
-                json=result.dict(),
-                timeout=aiohttp.ClientTimeout(total=10)
-            ) as response:
-                if response.status not in [200, 201, 202]:
-                    logger.error(f"Callback failed: {response.status}")
+        session = await _get_http_session()
+        async with session.post(
+            callback_url,
+            data=result.model_dump_json(),
+            headers={"Content-Type": "application/json"},
+        ) as response:
+            if response.status not in [200, 201, 202]:
+                logger.error(f"Callback failed: {response.status}")
     except Exception as e:
         logger.error(f"Error sending callback: {e}")
@@ -2,30 +2,55 @@
 Модуль для настройки и работы с базой данных.
 """
 
-from sqlalchemy import create_engine
+import orjson
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
 
 from config.settings import settings
 
-# Создаем движок для подключения к базе данных
-engine = create_engine(
-    settings.DATABASE_URL,
+# Асинхронные драйверы для синхронных схем URL
+_ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "postgresql+psycopg2": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+
+def get_async_database_url(url: str) -> str:
+    """Подставляет асинхронный драйвер в URL базы данных."""
+    scheme, sep, rest = url.partition("://")
+    return f"{_ASYNC_DRIVERS.get(scheme, scheme)}{sep}{rest}"
+
+
+DATABASE_URL = get_async_database_url(settings.database_url)
+
+# Размер пула задаем только для серверных СУБД, SQLite использует собственный пул
+_pool_options = {} if DATABASE_URL.startswith("sqlite") else {"pool_size": 20, "max_overflow": 10}
+
+
+def _json_serializer(value) -> str:
+    """Сериализация JSON/JSONB колонок через orjson."""
+    return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS).decode()
+
+
+# Создаем асинхронный движок, чтобы запросы к БД не блокировали event loop
+engine = create_async_engine(
+    DATABASE_URL,
     pool_pre_ping=True,  # Проверяет соединение перед использованием
     pool_recycle=3600,  # Переподключается каждые 3600 секунд
+    json_serializer=_json_serializer,
+    json_deserializer=orjson.loads,
+    **_pool_options,
 )
 
 # Создаем фабрику сессий
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+AsyncSessionLocal = async_sessionmaker(engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
 
 # Базовый класс для всех моделей SQLAlchemy
 Base = declarative_base()
 
 
 # Функция для получения сессии базы данных
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
@@ -7,12 +7,24 @@ AIOps Core API
 import asyncio
 import contextlib
 
-from fastapi import BackgroundTasks, FastAPI, HTTPException, Request
+import orjson
+from fastapi import BackgroundTasks, FastAPI, HTTPException, Request, Response
+from fastapi.responses import ORJSONResponse
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Gauge, generate_latest
 
 from app.models.schemas import AnalysisRequest, ApprovalRequest, RemediationPlan, SystemStatus
-from app.services import analysis_service, system_service, telegram_service
+from app.services import (
+    ai_service,
+    analysis_service,
+    notification_queue,
+    qwen_service,
+    system_service,
+    telegram_service,
+)
+from app.services.cache_service import redis_memoize
 from app.services.notification_service import notification_service
-from app.services.streaming_service import streaming_service
+from app.services.streaming_service import decode_log_batch, streaming_service
+from app.utils.json_utils import parse_json
 from app.utils.logger import logger
 from config.settings import settings
 
@@ -21,11 +33,41 @@ app = FastAPI(
     description="Центральный API для управления AIOps системой",
     version="2.0.0",
     debug=settings.api_debug,
+    default_response_class=ORJSONResponse,
 )
 
 # Background tasks
 _background_tasks = []
 
+# Status endpoints are polled by dashboards; cache their responses briefly
+STATUS_CACHE_TTL = 5
+
+# Prometheus metrics (отдельный реестр - только метрики AIOps)
+METRICS_REGISTRY = CollectorRegistry()
+NOTIFICATIONS_AVAILABLE = Gauge(
+    "aiops_notifications_available", "Notification queue reachable", registry=METRICS_REGISTRY
+)
+NOTIFICATIONS_PENDING = Gauge("aiops_notifications_pending", "Pending notifications", registry=METRICS_REGISTRY)
+NOTIFICATIONS_FAILED = Gauge("aiops_notifications_failed", "Failed notifications", registry=METRICS_REGISTRY)
+NOTIFICATIONS_PROCESSED = Gauge(
+    "aiops_notifications_processed", "Processed notifications", registry=METRICS_REGISTRY
+)
+STREAM_AVAILABLE = Gauge("aiops_stream_available", "Log stream reachable", registry=METRICS_REGISTRY)
+STREAM_LENGTH = Gauge("aiops_stream_length", "Log stream length", registry=METRICS_REGISTRY)
+
+# Ответы / и /health не меняются за время жизни процесса - сериализуем один раз
+_ROOT_BYTES = orjson.dumps({"status": "AIOps Core API is running", "version": "2.0.0"})
+_HEALTH_BYTES = orjson.dumps(
+    {
+        "status": "healthy",
+        "services": {
+            "api": True,
+            "notifications": settings.enable_notifications,
+            "streaming": settings.streaming_enabled,
+        },
+    }
+)
+
 
 @app.on_event("startup")
 async def startup_event():
@@ -38,6 +80,9 @@ async def startup_event():
         _background_tasks.append(task)
         logger.info("Notification processor started")
 
+    # Start batched Telegram notifications
+    notification_queue.start_flusher()
+
     # Initialize streaming service
     if settings.streaming_enabled:
         await streaming_service.initialize()
@@ -54,6 +99,9 @@ async def shutdown_event():
     # Stop notification processor
     await notification_service.stop_processor()
 
+    # Flush pending Telegram notifications
+    await notification_queue.stop_flusher()
+
     # Stop streaming consumer
     await streaming_service.stop_consumer()
 
@@ -63,8 +111,12 @@ async def shutdown_event():
         with contextlib.suppress(asyncio.CancelledError):
             await task
 
-    # Close data collector connections
-    await analysis_service.data_collector.close()
+    # Close shared Elasticsearch/Prometheus clients
+    await analysis_service.close_shared_clients()
+
+    # Close shared LLM connection pool
+    await ai_service.close_llm_clients()
+    await qwen_service.close_session()
 
     logger.info("AIOps Core API остановлен")
 
@@ -75,41 +127,38 @@ async def shutdown_event():
 @app.get("/", tags=["General"])
 async def read_root():
     """Проверка работоспособности API."""
-    return {"status": "AIOps Core API is running", "version": "2.0.0"}
+    return Response(content=_ROOT_BYTES, media_type="application/json")
 
 
 @app.get("/health", tags=["General"])
 async def health_check():
     """Health check endpoint for Docker/K8s."""
-    return {
-        "status": "healthy",
-        "services": {
-            "api": True,
-            "notifications": settings.enable_notifications,
-            "streaming": settings.streaming_enabled,
-        },
-    }
+    return Response(content=_HEALTH_BYTES, media_type="application/json")
 
 
 @app.get("/status", response_model=SystemStatus, tags=["System"])
+@redis_memoize(ttl=STATUS_CACHE_TTL, key_prefix="status:v1")
 async def get_system_status():
     """Получение полного статуса системы."""
     return await system_service.get_full_system_status()
 
 
 @app.get("/status/data-sources", tags=["System"])
+@redis_memoize(ttl=STATUS_CACHE_TTL, key_prefix="status:v1")
 async def get_data_sources_status():
     """Get status of data sources (Elasticsearch, Prometheus) with circuit breaker info."""
     return await analysis_service.get_data_sources_status()
 
 
 @app.get("/status/notifications", tags=["System"])
+@redis_memoize(ttl=STATUS_CACHE_TTL, key_prefix="status:v1")
 async def get_notification_status():
     """Get notification queue status."""
     return await notification_service.queue.get_queue_stats()
 
 
 @app.get("/status/streaming", tags=["System"])
+@redis_memoize(ttl=STATUS_CACHE_TTL, key_prefix="status:v1")
 async def get_streaming_status():
     """Get streaming service status."""
     return await streaming_service.get_stream_info()
@@ -171,7 +220,7 @@ async def alertmanager_webhook(request: Request, background_tasks: BackgroundTas
         raise HTTPException(status_code=403, detail="Alertmanager webhook is disabled")
 
     try:
-        payload = await request.json()
+        payload = await parse_json(request)
         logger.info(f"Received Alertmanager webhook: {payload.get('status')}")
 
         # Process in background
@@ -193,23 +242,9 @@ async def logs_webhook(request: Request):
         raise HTTPException(status_code=403, detail="Streaming is disabled")
 
     try:
-        payload = await request.json()
-
         # Handle both single log and batch
-        logs = payload if isinstance(payload, list) else [payload]
-
-        from app.services.streaming_service import LogEntry
-
-        for log_data in logs:
-            log_entry = LogEntry(
-                timestamp=log_data.get("@timestamp", log_data.get("timestamp", "")),
-                service=log_data.get("service", {}).get("name", log_data.get("service", "unknown")),
-                level=log_data.get("log", {}).get("level", log_data.get("level", "info")),
-                message=log_data.get("message", ""),
-                source=log_data.get("source", ""),
-                metadata=log_data,
-            )
-            await streaming_service.buffer_log(log_entry)
+        logs = decode_log_batch(await request.body())
+        await streaming_service.buffer_logs(logs)
 
         return {"status": "accepted", "count": len(logs)}
     except Exception as e:
@@ -223,7 +258,7 @@ async def custom_webhook(request: Request, background_tasks: BackgroundTasks):
     Generic webhook endpoint for custom integrations.
     """
     try:
-        payload = await request.json()
+        payload = await parse_json(request)
         event_type = payload.get("event_type", "unknown")
 
         logger.info(f"Received custom webhook: {event_type}")
@@ -249,7 +284,7 @@ async def send_notification(request: Request):
     Send a notification through configured channels.
     """
     try:
-        payload = await request.json()
+        payload = await parse_json(request)
 
         from app.services.notification_service import send_alert
 
@@ -274,20 +309,23 @@ async def prometheus_metrics():
     """
     Prometheus metrics endpoint.
     """
-    # Basic metrics - can be extended with prometheus_client library
-    queue_stats = await notification_service.queue.get_queue_stats()
-    stream_info = await streaming_service.get_stream_info()
-
-    metrics = []
+    queue_stats, stream_info = await asyncio.gather(
+        notification_service.queue.get_queue_stats(),
+        streaming_service.get_stream_info(),
+    )
 
     # Notification queue metrics
-    if queue_stats.get("available"):
-        metrics.append(f'aiops_notifications_pending {queue_stats.get("pending", 0)}')
-        metrics.append(f'aiops_notifications_failed {queue_stats.get("failed", 0)}')
-        metrics.append(f'aiops_notifications_processed {queue_stats.get("processed", 0)}')
+    notifications_available = bool(queue_stats.get("available"))
+    NOTIFICATIONS_AVAILABLE.set(notifications_available)
+    if notifications_available:
+        NOTIFICATIONS_PENDING.set(queue_stats.get("pending", 0))
+        NOTIFICATIONS_FAILED.set(queue_stats.get("failed", 0))
+        NOTIFICATIONS_PROCESSED.set(queue_stats.get("processed", 0))
 
     # Streaming metrics
-    if stream_info.get("available"):
-        metrics.append(f'aiops_stream_length {stream_info.get("length", 0)}')
+    stream_available = bool(stream_info.get("available"))
+    STREAM_AVAILABLE.set(stream_available)
+    if stream_available:
+        STREAM_LENGTH.set(stream_info.get("length", 0))
 
-    return "\n".join(metrics)
+    return Response(content=generate_latest(METRICS_REGISTRY), headers={"Content-Type": CONTENT_TYPE_LATEST})
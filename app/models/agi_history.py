@@ -1,6 +1,7 @@
 import datetime
 
 from sqlalchemy import JSON, Column, DateTime, ForeignKey, Integer, String
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 
@@ -14,6 +15,6 @@ class AGIHistory(Base):
     timestamp = Column(DateTime, default=datetime.datetime.utcnow)
     cycle_id = Column(Integer, ForeignKey("cycles.id"))
     event_type = Column(String)
-    details = Column(JSON)
+    details = Column(JSON().with_variant(JSONB, "postgresql"))
 
     cycle = relationship("Cycle", back_populates="agi_events")
@@ -6,8 +6,9 @@ import enum
 import uuid
 from datetime import datetime
 
-from sqlalchemy import JSON, Column, DateTime, Enum as SQLAlchemyEnum, ForeignKey, String
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy import JSON, Column, DateTime, ForeignKey, Index, String, insert
+from sqlalchemy.dialects.postgresql import ENUM as PgEnum, JSONB, UUID
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import relationship
 
 from app.database import Base
@@ -38,16 +39,46 @@ class StepStatus(enum.Enum):
     SKIPPED = "SKIPPED"
 
 
+# Нативные типы ENUM PostgreSQL (4 байта на значение). Имена типов зафиксированы
+# явно и совпадают с теми, что раньше выводились из имен классов.
+cycle_status_enum = PgEnum(CycleStatus, name="cyclestatus", create_type=True)
+step_name_enum = PgEnum(StepName, name="stepname", create_type=True)
+step_status_enum = PgEnum(StepStatus, name="stepstatus", create_type=True)
+
+
+# Размер страницы для INSERT ... VALUES (...), (...) при массовой вставке
+BULK_INSERT_PAGE_SIZE = 10_000
+
+
+class BulkInsertMixin:
+    """Массовая вставка строк одним executemany вместо session.add() на каждую запись."""
+
+    @classmethod
+    async def bulk_insert(cls, session: AsyncSession, rows: list[dict]) -> None:
+        """
+        Вставляет строки через Core insert() (insertmanyvalues).
+        Значения по умолчанию колонок (id, start_time, status) подставляются как при ORM-вставке.
+        """
+        if not rows:
+            return
+        stmt = insert(cls).execution_options(insertmanyvalues_page_size=BULK_INSERT_PAGE_SIZE)
+        await session.execute(stmt, rows)
+
+
 # --- Основная таблица: RemediationCycle ---
-class RemediationCycle(Base):
+class RemediationCycle(BulkInsertMixin, Base):
     __tablename__ = "remediation_cycles"
+    __table_args__ = (
+        # Выборка активных циклов: WHERE status = ... ORDER BY start_time DESC
+        Index("ix_remediation_cycles_status_start_time", "status", "start_time"),
+    )
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     start_time = Column(DateTime, default=datetime.utcnow)
     end_time = Column(DateTime, nullable=True)
-    status = Column(SQLAlchemyEnum(CycleStatus), default=CycleStatus.IN_PROGRESS)
+    status = Column(cycle_status_enum, default=CycleStatus.IN_PROGRESS)
     device_type = Column(String, nullable=False)
-    device_host = Column(String, nullable=False)
+    device_host = Column(String, nullable=False, index=True)
     initial_problem = Column(String, nullable=False)
     final_summary = Column(String, nullable=True)
 
@@ -60,16 +91,22 @@ class RemediationCycle(Base):
 
 
 # --- Таблица для шагов цикла: CycleStep ---
-class CycleStep(Base):
+class CycleStep(BulkInsertMixin, Base):
     __tablename__ = "cycle_steps"
+    __table_args__ = (
+        # Шаги конкретного цикла (в т.ч. по имени шага); покрывает и FK cycle_id
+        Index("ix_cycle_steps_cycle_id_step_name", "cycle_id", "step_name"),
+        # Запросы по содержимому details (@>, ?) на PostgreSQL
+        Index("ix_cycle_steps_details_gin", "details", postgresql_using="gin"),
+    )
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     cycle_id = Column(UUID(as_uuid=True), ForeignKey("remediation_cycles.id"), nullable=False)
-    step_name = Column(SQLAlchemyEnum(StepName), nullable=False)
+    step_name = Column(step_name_enum, nullable=False)
     start_time = Column(DateTime, default=datetime.utcnow)
     end_time = Column(DateTime, nullable=True)
-    status = Column(SQLAlchemyEnum(StepStatus), default=StepStatus.PENDING)
-    details = Column(JSON, nullable=True)  # Хранение любой дополнительной информации
+    status = Column(step_status_enum, default=StepStatus.PENDING)
+    details = Column(JSON().with_variant(JSONB, "postgresql"), nullable=True)  # Хранение любой дополнительной информации
 
     # Связь с основным циклом
     cycle = relationship("RemediationCycle", back_populates="steps")
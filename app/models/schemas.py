@@ -4,6 +4,7 @@ Pydantic модели для API
 
 from datetime import datetime
 from enum import Enum
+from typing import Any, ClassVar
 
 from pydantic import BaseModel
 
@@ -28,7 +29,35 @@ class ActionStatus(str, Enum):
     FAILED = "failed"
 
 
-class LogAnalysisResult(BaseModel):
+class TrustedModel(BaseModel):
+    """Модель, которую можно восстановить без валидации из доверенных данных (кэш, БД)"""
+
+    _trusted_enum_fields: ClassVar[dict[str, type[Enum]]] = {}
+
+    @classmethod
+    def __pydantic_init_subclass__(cls, **kwargs: Any) -> None:
+        super().__pydantic_init_subclass__(**kwargs)
+        cls._trusted_enum_fields = {
+            name: field.annotation
+            for name, field in cls.model_fields.items()
+            if isinstance(field.annotation, type) and issubclass(field.annotation, Enum)
+        }
+
+    @classmethod
+    def from_trusted(cls, data: dict[str, Any]):
+        """
+        Создает модель через model_construct, минуя валидацию.
+        Только для данных, ранее записанных самим сервисом; Enum-поля из строк
+        приводятся к Enum, остальные значения используются как есть.
+        """
+        for name, enum_cls in cls._trusted_enum_fields.items():
+            value = data.get(name)
+            if value is not None and not isinstance(value, enum_cls):
+                data = {**data, name: enum_cls(value)}
+        return cls.model_construct(**data)
+
+
+class LogAnalysisResult(TrustedModel):
     """Результат анализа логов"""
 
     summary: str
@@ -60,7 +89,7 @@ class MetricsAnomalyResult(BaseModel):
     timestamp: datetime = None
 
 
-class RemediationPlan(BaseModel):
+class RemediationPlan(TrustedModel):
     """План исправления проблемы"""
 
     plan_id: str
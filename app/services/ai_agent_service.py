@@ -5,12 +5,17 @@ AI Agent Service - Интеллектуальный агент для поним
 определяет намерения (intents) и извлекает параметры для выполнения действий.
 """
 
-import json
+import asyncio
+import hashlib
 import re
 from typing import Optional
 from dataclasses import dataclass, field
+from functools import cached_property
 from enum import Enum
 
+import orjson
+from cachetools import TTLCache
+
 from app.services.ai_service import AIService
 from app.services.cache_service import CacheService
 from app.utils.logger import get_logger
@@ -59,7 +64,15 @@ class Intent(Enum):
     UNKNOWN = "unknown"
 
 
-@dataclass
+# Эмодзи для форматирования ответов
+_SEVERITY_EMOJI = {"critical": "🔴", "warning": "🟡", "info": "🔵"}
+_VM_STATUS_EMOJI = {"running": "🟢", "stopped": "🔴"}
+
+# Поиск Intent по строковому значению без try/except вокруг Intent(value)
+_INTENT_BY_VALUE = {member.value: member for member in Intent}
+
+
+@dataclass(slots=True, frozen=True)
 class ParsedIntent:
     """Результат парсинга намерения пользователя."""
     
@@ -81,6 +94,77 @@ class ParsedIntent:
         }
 
 
+# Локальный кэш намерений: размер и время жизни записей (сек)
+L1_CACHE_SIZE = 4096
+L1_CACHE_TTL = 900
+
+# Максимум одновременных фоновых записей в Redis
+CACHE_WRITE_CONCURRENCY = 32
+
+# Паттерны извлечения параметров (компилируются один раз при импорте)
+_IP_RE = re.compile(r'\b(\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3})\b')
+_VM_RE = re.compile(r'\b(?:vm|вм|id)\s*[:#]?\s*(\d+)\b', re.IGNORECASE)
+_SERVICES = ("nginx", "apache", "mysql", "postgres", "redis", "docker", "api", "bot")
+_SERVICE_RE = re.compile("|".join(map(re.escape, _SERVICES)), re.IGNORECASE)
+_DIGIT_RE = re.compile(r"\d")
+_NUMERIC_TIME_RES = (
+    (re.compile(r"(\d+)\s*(?:час|hour|h)", re.IGNORECASE), "timeframe", "{0}h"),
+    (re.compile(r"(\d+)\s*(?:мин|min|m)", re.IGNORECASE), "timeframe", "{0}m"),
+    (re.compile(r"(\d+)\s*(?:день|day|d)", re.IGNORECASE), "timeframe", "{0}d"),
+)
+_PERIOD_RES = (
+    (re.compile(r"недел|week", re.IGNORECASE), "period", "week"),
+    (re.compile(r"месяц|month", re.IGNORECASE), "period", "month"),
+)
+_TIME_RES = _NUMERIC_TIME_RES + _PERIOD_RES
+
+
+def _intent_cache_key(message_lower: str) -> str:
+    """
+    Ключ кэша для распознанного намерения по сообщению в нижнем регистре.
+    
+    Стабилен между процессами (в отличие от встроенного hash()),
+    поэтому результаты переиспользуются всеми воркерами через Redis.
+    """
+    digest = hashlib.blake2b(message_lower.encode("utf-8"), digest_size=16).hexdigest()
+    return f"intent:{digest}"
+
+
+def _extract_json_object(text: str) -> Optional[str]:
+    """
+    Возвращает первый сбалансированный JSON-объект из текста ответа LLM.
+    
+    Один проход слева направо со счетчиком вложенности; скобки внутри
+    строковых литералов не учитываются.
+    """
+    start = text.find("{")
+    if start == -1:
+        return None
+    
+    depth = 0
+    in_string = False
+    escaped = False
+    for i in range(start, len(text)):
+        char = text[i]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char == "{":
+            depth += 1
+        elif char == "}":
+            depth -= 1
+            if depth == 0:
+                return text[start:i + 1]
+    
+    return None
+
+
 class AIAgentService:
     """
     AI-агент для обработки естественной речи.
@@ -150,37 +234,52 @@ class AIAgentService:
 Опасные операции (requires_confirmation=true): restart_service, stop_service, restart_vm, block_ip, run_playbook
 """
 
+    # Системный промпт не зависит от запроса, форматируем его один раз
+    FORMATTED_SYSTEM_PROMPT = SYSTEM_PROMPT.format(examples=INTENT_EXAMPLES)
+
     def __init__(self):
-        self.ai_service = AIService()
-        self.cache_service = CacheService()
+        # L1-кэш распознанных намерений в памяти процесса перед Redis
+        self._l1_cache: TTLCache = TTLCache(maxsize=L1_CACHE_SIZE, ttl=L1_CACHE_TTL)
+        
+        # Фоновые записи в Redis: ссылки на задачи (чтобы их не собрал GC) и ограничение параллелизма
+        self._background_tasks: set[asyncio.Task] = set()
+        self._cache_write_semaphore = asyncio.Semaphore(CACHE_WRITE_CONCURRENCY)
         
         # Паттерны для быстрого определения намерений без LLM
+        # Один паттерн на намерение: общие префиксы/суффиксы вынесены в группы,
+        # перекрывающиеся варианты убраны (например, "проанализируй.*лог" ⊂ "анализ.*лог")
         self.quick_patterns = {
-            Intent.CHECK_STATUS: [
-                r"статус", r"status", r"как дела", r"что происходит"
-            ],
-            Intent.HELP: [
-                r"помощь", r"help", r"помоги", r"что умеешь", r"команды"
-            ],
-            Intent.GET_ALERTS: [
-                r"алерт", r"alert", r"тревог", r"предупрежд"
-            ],
-            Intent.ANALYZE_LOGS: [
-                r"анализ.*лог", r"проанализируй.*лог", r"analyze.*log"
-            ],
-            Intent.FIND_ERRORS: [
-                r"найди.*ошибк", r"поиск.*ошибок", r"find.*error", r"ошибки"
-            ],
-            Intent.LIST_VMS: [
-                r"список.*vm", r"виртуалк", r"list.*vm", r"вм"
-            ],
-            Intent.CHECK_NETWORK: [
-                r"сеть", r"network", r"пинг", r"ping", r"связь"
-            ],
-            Intent.RESTART_SERVICE: [
-                r"перезапусти", r"restart", r"рестарт"
-            ],
+            Intent.CHECK_STATUS: r"статус|status|как дела|что происходит",
+            Intent.HELP: r"помо(?:щь|ги)|help|что умеешь|команды",
+            Intent.GET_ALERTS: r"алерт|alert|тревог|предупрежд",
+            Intent.ANALYZE_LOGS: r"анализ.*лог|analyze.*log",
+            Intent.FIND_ERRORS: r"найди.*ошибк|поиск.*ошибок|find.*error|ошибки",
+            Intent.LIST_VMS: r"(?:список|list).*vm|виртуало?к|вм",
+            Intent.CHECK_NETWORK: r"сеть|network|пинг|ping|связь",
+            Intent.RESTART_SERVICE: r"перезапусти|restart|рестарт",
         }
+        
+        # Все паттерны сведены в одно регулярное выражение с именованными альтернативами,
+        # и сообщение просматривается за один проход. Альтернативы обернуты в lookahead
+        # нулевой ширины, чтобы жадное совпадение одного намерения не скрыло другое.
+        # При нескольких совпадениях побеждает намерение, объявленное раньше
+        # (как в последовательном переборе).
+        self._fused_re = re.compile(
+            "(?=" + "|".join(
+                f"(?P<{intent.name}>{pattern})" for intent, pattern in self.quick_patterns.items()
+            ) + ")"
+        )
+        self._intent_priority = {intent.name: i for i, intent in enumerate(self.quick_patterns)}
+    
+    @cached_property
+    def ai_service(self) -> AIService:
+        """LLM-клиент создается при первом обращении: быстрым паттернам он не нужен."""
+        return AIService()
+    
+    @cached_property
+    def cache_service(self) -> CacheService:
+        """Кэш создается при первом обращении (промах по быстрым паттернам)."""
+        return CacheService()
     
     async def parse_message(self, message: str, context: Optional[dict] = None) -> ParsedIntent:
         """
@@ -196,104 +295,214 @@ class AIAgentService:
         message = message.strip()
         
         if not message:
-            return ParsedIntent(
-                intent=Intent.UNKNOWN,
-                confidence=1.0,
-                original_message=message,
-                suggested_response="Пожалуйста, введите сообщение."
-            )
+            return self._empty_message_intent()
+        
+        # str.lower() уже имеет быстрый путь для ASCII в C; str.translate с
+        # таблицей заметно медленнее, поэтому приводим регистр один раз здесь
+        message_lower = message.lower()
         
         # Попробуем быстрое определение по паттернам
-        quick_result = self._quick_pattern_match(message)
+        quick_result = self._quick_pattern_match(message, message_lower)
         if quick_result and quick_result.confidence > 0.8:
             logger.info(f"Quick pattern match: {quick_result.intent.value}")
             return quick_result
         
-        # Проверяем кэш
-        cache_key = f"intent:{hash(message.lower())}"
+        # Проверяем локальный кэш процесса, затем Redis
+        cache_key = _intent_cache_key(message_lower)
+        cached = self._l1_cache.get(cache_key)
+        if cached:
+            return self._dict_to_parsed_intent(cached, message)
+        
         cached = await self.cache_service.get(cache_key)
         if cached:
             logger.info(f"Cache hit for intent parsing")
+            self._l1_cache[cache_key] = cached
             return self._dict_to_parsed_intent(cached, message)
         
         # Используем LLM для понимания намерения
         try:
             result = await self._parse_with_llm(message, context)
             
-            # Кэшируем результат
-            await self.cache_service.set(cache_key, result.to_dict(), ttl=1800)
+            # Кэшируем результат (запись в Redis - в фоне, не задерживая ответ)
+            result_dict = result.to_dict()
+            self._l1_cache[cache_key] = result_dict
+            self._schedule_cache_write(cache_key, result_dict)
             
             return result
             
         except Exception as e:
             logger.error(f"Error parsing message with LLM: {e}")
             # Fallback на быстрое определение
-            return quick_result or ParsedIntent(
-                intent=Intent.UNKNOWN,
-                confidence=0.5,
-                original_message=message,
-                suggested_response="Извините, не удалось понять ваш запрос. Попробуйте переформулировать или введите /help для справки."
+            return quick_result or self._fallback_intent(message)
+    
+    async def parse_batch(self, messages: list[str], context: Optional[dict] = None) -> list[ParsedIntent]:
+        """
+        Парсит пачку сообщений (например, при воспроизведении истории чата).
+        
+        Кэш читается одним MGET и пишется одним пайплайном, а сообщения,
+        которые не распознаны паттернами и не найдены в кэше, разбираются
+        LLM параллельно (одинаковые сообщения - один раз).
+        
+        Args:
+            messages: Сообщения пользователя
+            context: Общий контекст для всех сообщений
+            
+        Returns:
+            Список ParsedIntent в том же порядке, что и messages
+        """
+        results: list[Optional[ParsedIntent]] = [None] * len(messages)
+        pending: dict[str, list[int]] = {}
+        quick_results: dict[int, Optional[ParsedIntent]] = {}
+        
+        for i, raw in enumerate(messages):
+            message = raw.strip()
+            if not message:
+                results[i] = self._empty_message_intent()
+                continue
+            
+            message_lower = message.lower()
+            quick_result = self._quick_pattern_match(message, message_lower)
+            if quick_result and quick_result.confidence > 0.8:
+                results[i] = quick_result
+                continue
+            
+            quick_results[i] = quick_result
+            cache_key = _intent_cache_key(message_lower)
+            cached = self._l1_cache.get(cache_key)
+            if cached:
+                results[i] = self._dict_to_parsed_intent(cached, message)
+                continue
+            
+            pending.setdefault(cache_key, []).append(i)
+        
+        if not pending:
+            return results
+        
+        keys = list(pending)
+        cached_values = await self.cache_service.mget(keys)
+        
+        misses = []
+        for key, cached in zip(keys, cached_values):
+            if cached:
+                self._l1_cache[key] = cached
+                for i in pending[key]:
+                    results[i] = self._dict_to_parsed_intent(cached, messages[i].strip())
+            else:
+                misses.append(key)
+        
+        if misses:
+            llm_results = await asyncio.gather(
+                *(self._parse_with_llm(messages[pending[key][0]].strip(), context) for key in misses),
+                return_exceptions=True
             )
+            
+            to_cache = {}
+            for key, result in zip(misses, llm_results):
+                if isinstance(result, Exception):
+                    logger.error(f"Error parsing message with LLM: {result}")
+                    for i in pending[key]:
+                        results[i] = quick_results[i] or self._fallback_intent(messages[i].strip())
+                    continue
+                
+                to_cache[key] = self._l1_cache[key] = result.to_dict()
+                for i in pending[key]:
+                    results[i] = self._dict_to_parsed_intent(to_cache[key], messages[i].strip())
+            
+            await self.cache_service.mset(to_cache, ttl=1800)
+        
+        return results
     
-    def _quick_pattern_match(self, message: str) -> Optional[ParsedIntent]:
-        """Быстрое определение намерения по паттернам."""
-        message_lower = message.lower()
+    def _schedule_cache_write(self, cache_key: str, value: dict) -> None:
+        """Запускает запись в Redis фоновой задачей."""
+        task = asyncio.create_task(self._write_cache(cache_key, value))
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+    
+    async def _write_cache(self, cache_key: str, value: dict) -> None:
+        """Пишет результат в Redis с ограничением числа одновременных записей."""
+        async with self._cache_write_semaphore:
+            try:
+                await self.cache_service.set(cache_key, value, ttl=1800)
+            except Exception as e:
+                logger.warning(f"Failed to cache parsed intent: {e}")
+    
+    def _empty_message_intent(self) -> ParsedIntent:
+        """Ответ на пустое сообщение."""
+        return ParsedIntent(
+            intent=Intent.UNKNOWN,
+            confidence=1.0,
+            original_message="",
+            suggested_response="Пожалуйста, введите сообщение."
+        )
+    
+    def _fallback_intent(self, message: str) -> ParsedIntent:
+        """Ответ, когда намерение не удалось определить из-за ошибки LLM."""
+        return ParsedIntent(
+            intent=Intent.UNKNOWN,
+            confidence=0.5,
+            original_message=message,
+            suggested_response="Извините, не удалось понять ваш запрос. Попробуйте переформулировать или введите /help для справки."
+        )
+    
+    def _quick_pattern_match(self, message: str, message_lower: Optional[str] = None) -> Optional[ParsedIntent]:
+        """
+        Быстрое определение намерения по паттернам.
         
-        for intent, patterns in self.quick_patterns.items():
-            for pattern in patterns:
-                if re.search(pattern, message_lower):
-                    # Извлекаем параметры
-                    params = self._extract_quick_params(message, intent)
-                    
-                    return ParsedIntent(
-                        intent=intent,
-                        confidence=0.85,
-                        parameters=params,
-                        original_message=message,
-                        suggested_response=self._get_quick_response(intent, params),
-                        requires_confirmation=intent in [
-                            Intent.RESTART_SERVICE, 
-                            Intent.RESTART_VM,
-                            Intent.BLOCK_IP
-                        ]
-                    )
+        message_lower можно передать, если вызывающий код уже привел сообщение к нижнему регистру.
+        """
+        if message_lower is None:
+            message_lower = message.lower()
         
-        return None
+        matched = {match.lastgroup for match in self._fused_re.finditer(message_lower)}
+        if not matched:
+            return None
+        
+        intent = Intent[min(matched, key=self._intent_priority.__getitem__)]
+        
+        # Извлекаем параметры
+        params = self._extract_quick_params(message, intent)
+        
+        return ParsedIntent(
+            intent=intent,
+            confidence=0.85,
+            parameters=params,
+            original_message=message,
+            suggested_response=self._get_quick_response(intent, params),
+            requires_confirmation=intent in [
+                Intent.RESTART_SERVICE, 
+                Intent.RESTART_VM,
+                Intent.BLOCK_IP
+            ]
+        )
     
     def _extract_quick_params(self, message: str, intent: Intent) -> dict:
         """Извлекает параметры из сообщения для быстрого парсинга."""
         params = {}
         
+        # IP, VM ID и числовые периоды без цифр в сообщении не найдутся - не ищем их
+        has_digit = _DIGIT_RE.search(message) is not None
+        
         # IP адреса
-        ip_match = re.search(r'\b(\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3})\b', message)
+        ip_match = has_digit and _IP_RE.search(message)
         if ip_match:
             params["ip"] = ip_match.group(1)
         
         # VM ID
-        vm_match = re.search(r'\b(?:vm|вм|id)\s*[:#]?\s*(\d+)\b', message.lower())
+        vm_match = has_digit and _VM_RE.search(message)
         if vm_match:
             params["vm_id"] = vm_match.group(1)
         
-        # Имена сервисов
-        services = ["nginx", "apache", "mysql", "postgres", "redis", "docker", "api", "bot"]
-        for service in services:
-            if service in message.lower():
-                params["service"] = service
-                break
+        # Имена сервисов: один проход по сообщению, при нескольких совпадениях
+        # берется сервис, стоящий раньше в _SERVICES
+        found = {m.group().lower() for m in _SERVICE_RE.finditer(message)}
+        if found:
+            params["service"] = min(found, key=_SERVICES.index)
         
         # Временные периоды
-        time_patterns = {
-            r"(\d+)\s*(?:час|hour|h)": ("timeframe", lambda m: f"{m.group(1)}h"),
-            r"(\d+)\s*(?:мин|min|m)": ("timeframe", lambda m: f"{m.group(1)}m"),
-            r"(\d+)\s*(?:день|day|d)": ("timeframe", lambda m: f"{m.group(1)}d"),
-            r"недел|week": ("period", lambda m: "week"),
-            r"месяц|month": ("period", lambda m: "month"),
-        }
-        
-        for pattern, (key, extractor) in time_patterns.items():
-            match = re.search(pattern, message.lower())
+        for pattern, key, template in (_TIME_RES if has_digit else _PERIOD_RES):
+            match = pattern.search(message)
             if match:
-                params[key] = extractor(match)
+                params[key] = template.format(*match.groups())
                 break
         
         return params
@@ -318,15 +527,13 @@ class AIAgentService:
         
         prompt = f"""Сообщение пользователя: "{message}"
 
-{f"Контекст диалога: {json.dumps(context, ensure_ascii=False)}" if context else ""}
+{f"Контекст диалога: {orjson.dumps(context).decode()}" if context else ""}
 
 Определи намерение пользователя и извлеки параметры."""
 
-        system_prompt = self.SYSTEM_PROMPT.format(examples=self.INTENT_EXAMPLES)
-        
         response = await self.ai_service.generate_completion(
             prompt=prompt,
-            system_prompt=system_prompt,
+            system_prompt=self.FORMATTED_SYSTEM_PROMPT,
             temperature=0.3,
             max_tokens=500
         )
@@ -334,15 +541,12 @@ class AIAgentService:
         # Парсим JSON ответ
         try:
             # Извлекаем JSON из ответа
-            json_match = re.search(r'\{[\s\S]*\}', response)
-            if json_match:
-                data = json.loads(json_match.group())
+            json_text = _extract_json_object(response)
+            if json_text:
+                data = orjson.loads(json_text)
                 
                 intent_str = data.get("intent", "unknown")
-                try:
-                    intent = Intent(intent_str)
-                except ValueError:
-                    intent = Intent.UNKNOWN
+                intent = _INTENT_BY_VALUE.get(intent_str, Intent.UNKNOWN) if isinstance(intent_str, str) else Intent.UNKNOWN
                 
                 return ParsedIntent(
                     intent=intent,
@@ -352,7 +556,7 @@ class AIAgentService:
                     suggested_response=data.get("suggested_response", ""),
                     requires_confirmation=data.get("requires_confirmation", False)
                 )
-        except json.JSONDecodeError as e:
+        except orjson.JSONDecodeError as e:
             logger.error(f"Failed to parse LLM response as JSON: {e}")
         
         return ParsedIntent(
@@ -364,10 +568,7 @@ class AIAgentService:
     
     def _dict_to_parsed_intent(self, data: dict, original_message: str) -> ParsedIntent:
         """Конвертирует словарь в ParsedIntent."""
-        try:
-            intent = Intent(data.get("intent", "unknown"))
-        except ValueError:
-            intent = Intent.UNKNOWN
+        intent = _INTENT_BY_VALUE.get(data.get("intent"), Intent.UNKNOWN)
             
         return ParsedIntent(
             intent=intent,
@@ -409,8 +610,8 @@ class AIAgentService:
         prompt = f"""Сформулируй краткий и понятный ответ пользователю.
 
 Намерение: {intent.intent.value}
-Параметры: {json.dumps(intent.parameters, ensure_ascii=False)}
-Результат выполнения: {json.dumps(execution_result, ensure_ascii=False)}
+Параметры: {orjson.dumps(intent.parameters).decode()}
+Результат выполнения: {orjson.dumps(execution_result).decode()}
 
 Ответ должен быть на русском языке, кратким и информативным."""
 
@@ -456,11 +657,11 @@ class AIAgentService:
         
         lines = [f"🚨 **Активные алерты ({len(alerts)})**\n"]
         
-        for alert in alerts[:10]:  # Максимум 10 алертов
-            severity = alert.get("severity", "info")
-            emoji = {"critical": "🔴", "warning": "🟡", "info": "🔵"}.get(severity, "⚪")
-            lines.append(f"{emoji} **{alert.get('name', 'Unknown')}**")
-            lines.append(f"   {alert.get('description', 'No description')}")
+        lines.extend(
+            f"{_SEVERITY_EMOJI.get(alert.get('severity', 'info'), '⚪')} **{alert.get('name', 'Unknown')}**\n"
+            f"   {alert.get('description', 'No description')}"
+            for alert in alerts[:10]  # Максимум 10 алертов
+        )
         
         if len(alerts) > 10:
             lines.append(f"\n... и еще {len(alerts) - 10} алертов")
@@ -478,8 +679,7 @@ class AIAgentService:
         
         for vm in vms:
             status = vm.get("status", "unknown")
-            emoji = "🟢" if status == "running" else "🔴" if status == "stopped" else "🟡"
-            lines.append(f"{emoji} **{vm.get('name', 'Unknown')}** (ID: {vm.get('id', '?')})")
+            lines.append(f"{_VM_STATUS_EMOJI.get(status, '🟡')} **{vm.get('name', 'Unknown')}** (ID: {vm.get('id', '?')})")
             lines.append(f"   CPU: {vm.get('cpu', '?')} | RAM: {vm.get('memory', '?')} | Status: {status}")
         
         return "\n".join(lines)
@@ -8,17 +8,28 @@ Features:
 - Circuit Breaker для graceful degradation
 """
 
+import asyncio
+import contextlib
+import copy
 import hashlib
 import json
 import os
+import re
+from collections import deque
+from functools import lru_cache
+from itertools import groupby
 from typing import Any
 
-from openai import AsyncOpenAI
+import httpx
+from cachetools import TTLCache
+from openai import AsyncOpenAI, DefaultAioHttpClient, DefaultAsyncHttpxClient
+from pydantic import BaseModel
 
 from app.models.schemas import LogAnalysisResult, SeverityLevel
 from app.services.cache_service import cache
 from app.utils.circuit_breaker import (
     CircuitBreakerOpenError,
+    CircuitState,
     ollama_breaker,
     openai_breaker,
 )
@@ -26,9 +37,34 @@ from app.utils.logger import logger
 
 # ==================== LLM Clients ====================
 
+# Общий пул соединений для всех LLM клиентов (держим keep-alive между вызовами)
+LLM_HTTP_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=50, keepalive_expiry=60)
+
+_http_client: httpx.AsyncClient | None = None
+
+
+def _get_http_client() -> httpx.AsyncClient:
+    """
+    HTTP клиент для OpenAI SDK на aiohttp транспорте.
+
+    Под конкурентной нагрузкой aiohttp заметно быстрее стандартного httpx
+    транспорта. Без extra ``openai[aiohttp]`` используем httpx клиент SDK.
+    """
+    global _http_client
+    if _http_client is None:
+        try:
+            _http_client = DefaultAioHttpClient(limits=LLM_HTTP_LIMITS)
+        except RuntimeError as e:
+            logger.warning(f"aiohttp transport unavailable, using httpx: {e}")
+            _http_client = DefaultAsyncHttpxClient(limits=LLM_HTTP_LIMITS)
+    return _http_client
+
+
 # Primary: OpenAI client
 openai_client = AsyncOpenAI(
-    api_key=os.getenv("OPENAI_API_KEY"), base_url=os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1")
+    api_key=os.getenv("OPENAI_API_KEY"),
+    base_url=os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1"),
+    http_client=_get_http_client(),
 )
 
 # Fallback: Ollama client (OpenAI-compatible API)
@@ -42,65 +78,527 @@ def _get_ollama_client() -> AsyncOpenAI | None:
     global ollama_client
     if ollama_client is None:
         try:
-            ollama_client = AsyncOpenAI(api_key="ollama", base_url=OLLAMA_BASE_URL)  # Ollama doesn't need real API key
+            ollama_client = AsyncOpenAI(
+                api_key="ollama",  # Ollama doesn't need real API key
+                base_url=OLLAMA_BASE_URL,
+                http_client=_get_http_client(),
+            )
         except Exception as e:
             logger.warning(f"Failed to initialize Ollama client: {e}")
     return ollama_client
 
 
+async def close_llm_clients() -> None:
+    """Close the shared HTTP connection pool (call on application shutdown)."""
+    global _http_client
+    await _analysis_batcher.stop()
+    await _cheap_analysis_batcher.stop()
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+
 # Default models
 DEFAULT_MODEL = os.getenv("LLM_MODEL", "gpt-4.1-mini")
+# Дешевая модель для простых запросов (каскад: при неуверенном ответе - DEFAULT_MODEL)
+CHEAP_MODEL = os.getenv("LLM_CHEAP_MODEL", "gpt-4o-mini")
 
 # Cache TTLs (seconds)
 CACHE_TTL_ANALYSIS = 600  # 10 minutes for log analysis
 CACHE_TTL_PLAYBOOK = 1800  # 30 minutes for playbooks
 CACHE_TTL_NL = 300  # 5 minutes for NL interpretation
 
+# Markdown-обертка ответа LLM (```json ... ```); любая из оград может отсутствовать
+_FENCE_RE = re.compile(r"\s*(?:```(?:json|yaml)?)?\s*(.*?)\s*(?:```)?\s*", re.DOTALL)
+
+# ISO-8601 метки времени в логах: заменяются на <TS> перед дедупликацией строк
+_LOG_TS_RE = re.compile(r"\d{4}-\d{2}-\d{2}T[\d:.]+Z?")
+
+# Нормализация текста для ключа кэша: метки времени, PID/счетчики и пробельные серии
+_NORM_RE = re.compile(r"\d{4}-\d{2}-\d{2}T[\d:.]+Z?|\b\d{5,}\b|\s+", re.IGNORECASE)
+_WHITESPACE_RE = re.compile(r"\s+")
+
+# Однозначные короткие команды интерпретируются локально, без вызова LLM.
+# Шаблон якорный: команда с любыми уточнениями уходит в LLM.
+_LOCAL_COMMAND_RE = re.compile(
+    r"^\s*(?:"
+    r"(?P<list_vms>(?:покажи\s+)?(?:список\s+)?(?:vms?|вм|виртуалки|виртуальн\w*\s+машин\w*)|list\s+vms?)"
+    r"|(?P<get_status>(?:покажи\s+)?статус(?:\s+(?:системы|(?P<status_target>[\w.-]+)))?"
+    r"|(?:system\s+)?status)"
+    r"|(?P<vm_action>(?P<vm_verb>start|stop|reboot|запусти|останови|перезагрузи|перезапусти)"
+    r"\s+(?:vm|вм)\s+(?P<vmid>\d+))"
+    r"|(?P<restart_service>(?:перезапусти|рестартни|restart)\s+(?:сервис\s+|service\s+)?"
+    r"(?P<restart_target>[\w.-]+))"
+    r"|(?P<analyze_service>(?:проанализируй|analyze)\s+(?:сервис\s+|service\s+)?"
+    r"(?P<analyze_target>[\w.-]+))"
+    r")\s*[.!]?\s*$",
+    re.IGNORECASE,
+)
+# Цель команды принимается локально, только если это известный сервис или слово,
+# похожее на имя сервиса (payment-gateway, api.v2, redis2); иначе решает LLM
+_KNOWN_SERVICES = frozenset({"nginx", "apache", "mysql", "postgres", "postgresql", "redis", "docker", "elasticsearch"})
+_SERVICE_NAME_RE = re.compile(r"[-.\d]")
+_VM_VERBS = {
+    "start": "start",
+    "запусти": "start",
+    "stop": "stop",
+    "останови": "stop",
+    "reboot": "reboot",
+    "перезагрузи": "reboot",
+    "перезапусти": "reboot",
+}
+
+# Логи больше этого размера готовятся (дедупликация, нормализация, хэш) в пуле потоков
+OFFLOAD_PREPARE_SIZE = 64 * 1024
+
+# Hedging: пока OpenAI медленный (p95 выше порога), через HEDGE_DELAY_MS параллельно
+# запускаем Ollama и берем первый успешный ответ
+HEDGE_DELAY_MS = 300
+HEDGE_P95_THRESHOLD = float(os.getenv("LLM_HEDGE_P95_THRESHOLD", "5.0"))  # seconds
+HEDGE_MIN_SAMPLES = 20
+_openai_latencies: deque[float] = deque(maxlen=100)
+# Проигравшие гонку пробные запросы HALF_OPEN, которые доигрываются в фоне
+_openai_trials: set[asyncio.Task] = set()
+
+# Логи меньше этого размера без предупреждений/ошибок анализирует CHEAP_MODEL
+TRIVIAL_LOGS_MAX_SIZE = 1024
+_NON_INFO_LOG_RE = re.compile(r"\b(?:WARN(?:ING)?|ERROR|CRITICAL|FATAL|EXCEPTION|TRACEBACK)\b", re.IGNORECASE)
+# Severity, при которой ответ дешевой модели перепроверяется основной
+_ESCALATE_SEVERITIES = frozenset({"high", "critical"})
+
+# Пакетный анализ: одновременные запросы объединяются в один вызов LLM
+ANALYSIS_BATCH_MAX = 8
+ANALYSIS_BATCH_WAIT_MS = 50
+
+# Локальный (L1) кэш перед Redis: горячие ключи отдаются без сетевого запроса
+L1_CACHE_SIZE = 2048
+L1_CACHE_TTL = 60  # seconds
+_l1_cache: TTLCache = TTLCache(maxsize=L1_CACHE_SIZE, ttl=L1_CACHE_TTL)
+
+_SEVERITY_MAP = {
+    "low": SeverityLevel.LOW,
+    "medium": SeverityLevel.MEDIUM,
+    "high": SeverityLevel.HIGH,
+    "critical": SeverityLevel.CRITICAL,
+}
+
+# Бюджет токенов на запрос анализа (system + user), из него вычитается запас на служебные токены.
+# Логи обрезаются по токенам, а не по символам: кириллица занимает больше токенов на символ.
+ANALYSIS_PROMPT_TOKENS = 8000
+ANALYSIS_TOKEN_RESERVE = 256
+TOKENIZER_MODEL = "gpt-4o-mini"
+ANALYSIS_LOGS_MAX_CHARS = 8000  # если tiktoken недоступен
+_MAX_CHARS_PER_TOKEN = 8
+
+_token_encoder = None
+_token_encoder_unavailable = False
+
+# Сжатие логов LLMLingua-2 перед отправкой в LLM (опционально: модель тяжелая,
+# загружается при первом вызове и требует пакет llmlingua)
+LOG_COMPRESSION_ENABLED = os.getenv("LLM_LOG_COMPRESSION", "false").lower() == "true"
+LOG_COMPRESSION_MODEL = os.getenv("LLM_LOG_COMPRESSION_MODEL", "microsoft/llmlingua-2-xlm-roberta-large-meetingbank")
+LOG_COMPRESSION_RATE = 0.5
+_LOG_FORCE_TOKENS = ["ERROR", "CRITICAL", "Traceback"]
+
+_log_compressor = None
+_log_compressor_unavailable = False
+
+# ==================== System Prompts ====================
+# Системные промпты статичны и побайтно одинаковы между вызовами: провайдеры
+# с кэшированием префикса (OpenAI prompt caching) тарифицируют их как cache hit.
+# Не подставляйте сюда данные запроса - только в user-сообщение.
+
+_SYS_ANALYSIS = """Эксперт по анализу логов IT-инфраструктуры. Найди проблему в логах.
+Ответ - только JSON:
+{"summary": "краткое описание проблемы", "root_cause": "вероятная первопричина", "severity": "Low|Medium|High|Critical", "relevant_logs": ["ключевые строки лога"]}
+severity: Critical - сервис недоступен или потеря данных; High - ошибки, влияющие на пользователей; Medium - предупреждения; Low - информационные сообщения."""
+
+_SYS_PLAYBOOK = """Старший DevOps-инженер, эксперт по Ansible. Создай безопасный плейбук для исправления проблемы.
+Требования: идемпотентность; проверки перед опасными операциями; верификация после исправления; become: yes только при необходимости; комментарии на русском.
+Ответ - только YAML плейбука, без markdown."""
+
+_SYS_NL = """Интерпретатор команд AIOps. Преобразуй команду пользователя в действие.
+Действия:
+- get_status: target "system" или сервис
+- analyze_service: target сервис
+- run_playbook: target сервис, parameters.playbook_name
+- get_logs: target сервис, parameters.time_window
+- restart_service: target сервис
+- list_vms
+- vm_action: target vmid, parameters.action start|stop|reboot
+Команда не распознана: action "unknown".
+Ответ - только JSON: {"action": "...", "target": "...", "parameters": {}}"""
+
+# Шаблоны user-сообщений (данные подставляются через str.format)
+_USER_ANALYSIS_TMPL = """Проанализируй следующие логи и определи проблему:
+
+---
+{}
+---
+
+Верни результат в формате JSON."""
+
+_USER_BATCH_ANALYSIS_TMPL = (
+    'Проанализируй каждый блок логов и верни JSON {{"results": [...]}} из {} результатов '
+    "в формате выше, в порядке блоков:"
+)
+
+_USER_PLAYBOOK_TMPL = """На основе следующего контекста создай Ansible плейбук для исправления проблемы:
+
+---
+{}
+---
+
+Создай плейбук, который:
+1. Диагностирует текущее состояние
+2. Выполняет исправление
+3. Верифицирует результат"""
+
+
+# ==================== Structured Outputs ====================
+
+
+def _strict_json_schema(model: type[BaseModel]) -> dict:
+    """Schema of a model's required fields in the form accepted by strict structured outputs."""
+    schema = model.model_json_schema()
+    required = schema["required"]
+    return {
+        "type": "object",
+        "properties": {name: schema["properties"][name] for name in required},
+        "required": required,
+        "additionalProperties": False,
+        "$defs": schema.get("$defs", {}),
+    }
+
+
+_ANALYSIS_SCHEMA = _strict_json_schema(LogAnalysisResult)
+
+# OpenAI гарантирует JSON по схеме; Ollama получает обычный JSON mode
+_ANALYSIS_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {"name": "log_analysis", "schema": _ANALYSIS_SCHEMA, "strict": True},
+}
+_BATCH_ANALYSIS_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "log_analysis_batch",
+        "schema": {
+            "type": "object",
+            "properties": {
+                "results": {
+                    "type": "array",
+                    "items": {k: v for k, v in _ANALYSIS_SCHEMA.items() if k != "$defs"},
+                }
+            },
+            "required": ["results"],
+            "additionalProperties": False,
+            "$defs": _ANALYSIS_SCHEMA["$defs"],
+        },
+        "strict": True,
+    },
+}
+_JSON_OBJECT_FORMAT = {"type": "json_object"}
+
 
 # ==================== Helper Functions ====================
 
 
 def _clean_json_response(text: str) -> str:
     """Remove markdown wrappers from JSON response."""
-    if text.startswith("```json"):
-        text = text[7:]
-    if text.startswith("```"):
-        text = text[3:]
-    if text.endswith("```"):
-        text = text[:-3]
-    return text.strip()
+    return _FENCE_RE.fullmatch(text).group(1)
 
 
 def _clean_yaml_response(text: str) -> str:
     """Remove markdown wrappers from YAML response."""
-    if text.startswith("```yaml"):
-        text = text[7:]
-    if text.startswith("```"):
-        text = text[3:]
-    if text.endswith("```"):
-        text = text[:-3]
-    return text.strip()
+    return _FENCE_RE.fullmatch(text).group(1)
+
+
+def _cache_hash(text: str) -> str:
+    """Short non-cryptographic digest for cache keys."""
+    return hashlib.blake2b(text.encode(), digest_size=8).hexdigest()
+
+
+def _normalize_for_key(text: str) -> str:
+    """Normalize text so inputs differing only in timestamps, PIDs or whitespace share a cache key."""
+    return _NORM_RE.sub(" ", text.lower()).strip()
+
+
+def _dedupe_logs(logs: str) -> str:
+    """
+    Collapse runs of log lines that differ only by timestamps.
+
+    Repeated lines such as healthchecks become "(xN) line", keeping the first
+    original line of the run, which shrinks the prompt without hiding timestamps.
+    """
+    deduped = []
+    for _, group in groupby(logs.split("\n"), key=lambda line: _LOG_TS_RE.sub("<TS>", line)):
+        first = next(group)
+        count = 1 + sum(1 for _ in group)
+        deduped.append(first if count == 1 else f"(x{count}) {first}")
+    return "\n".join(deduped)
+
+
+def _prepare_logs(logs: str) -> tuple[str, str]:
+    """Deduplicate logs and compute their cache hash (CPU-bound, safe to run in a thread)."""
+    deduped = _dedupe_logs(logs)
+    return deduped, _cache_hash(_normalize_for_key(deduped))
+
+
+def _looks_like_service(target: str) -> bool:
+    """True for a known service or a word shaped like a service name (contains '-', '.' or a digit)."""
+    return target.lower() in _KNOWN_SERVICES or _SERVICE_NAME_RE.search(target) is not None
+
+
+def _match_local_command(query: str) -> dict | None:
+    """Interpret an unambiguous short command without the LLM; None if it needs one."""
+    match = _LOCAL_COMMAND_RE.match(query)
+    if match is None:
+        return None
+
+    action = match.lastgroup
+    target = match["status_target"] or match["restart_target"] or match["analyze_target"]
+    if target is not None and not _looks_like_service(target):
+        return None
+
+    if action == "get_status":
+        return {"action": action, "target": target or "system", "parameters": {}}
+    if action == "vm_action":
+        return {
+            "action": action,
+            "target": match["vmid"],
+            "parameters": {"action": _VM_VERBS[match["vm_verb"].lower()]},
+        }
+    if action == "restart_service":
+        return {"action": action, "target": target, "parameters": {}}
+    if action == "analyze_service":
+        return {"action": action, "target": target, "parameters": {}}
+    return {"action": action, "target": None, "parameters": {}}
+
+
+async def _cache_get(key: str) -> Any | None:
+    """Read through the in-process L1 cache, then Redis; Redis hits populate L1."""
+    value = _l1_cache.get(key)
+    if value is not None:
+        return copy.deepcopy(value)
+    value = await cache.get(key)
+    if value:
+        _l1_cache[key] = copy.deepcopy(value)
+    return value
+
+
+async def _cache_set(key: str, value: Any, ttl: int) -> None:
+    """Write to both L1 and Redis."""
+    _l1_cache[key] = copy.deepcopy(value)
+    await cache.set(key, value, ttl)
+
+
+def _normalize_analysis(result_json: dict) -> dict:
+    """Map the LLM's severity to the enum value and keep the LogAnalysisResult fields (cache format)."""
+    severity = _SEVERITY_MAP.get(str(result_json.get("severity", "medium")).lower(), SeverityLevel.MEDIUM)
+    return {
+        "summary": result_json.get("summary"),
+        "root_cause": result_json.get("root_cause"),
+        "severity": severity.value,
+        "relevant_logs": result_json.get("relevant_logs", []),
+    }
+
+
+def _degraded_analysis(logs: str, summary: str, root_cause: str) -> LogAnalysisResult:
+    """Placeholder result returned when the LLM analysis could not be obtained."""
+    return LogAnalysisResult(
+        summary=summary, root_cause=root_cause, severity=SeverityLevel.MEDIUM, relevant_logs=[logs[:500]]
+    )
+
+
+def _get_token_encoder():
+    """Lazy initialization of the tiktoken encoder (may download the BPE file on first use)."""
+    global _token_encoder, _token_encoder_unavailable
+    if _token_encoder is None and not _token_encoder_unavailable:
+        try:
+            import tiktoken
+
+            _token_encoder = tiktoken.encoding_for_model(TOKENIZER_MODEL)
+        except ImportError:
+            logger.warning("tiktoken package not installed, truncating logs by characters")
+            _token_encoder_unavailable = True
+        except Exception as e:
+            logger.warning(f"Failed to load tokenizer, truncating logs by characters: {e}")
+            _token_encoder_unavailable = True
+    return _token_encoder
+
+
+@lru_cache(maxsize=1)
+def _analysis_logs_token_budget() -> int:
+    """Tokens left for logs after the analysis prompts and the reserve."""
+    prompt_tokens = len(_get_token_encoder().encode(_SYS_ANALYSIS + _USER_ANALYSIS_TMPL))
+    return ANALYSIS_PROMPT_TOKENS - prompt_tokens - ANALYSIS_TOKEN_RESERVE
+
+
+def _truncate_logs(logs: str) -> str:
+    """Keep the tail of the logs (the most recent lines) that fits the analysis token budget."""
+    encoder = _get_token_encoder()
+    if encoder is None:
+        return logs[-ANALYSIS_LOGS_MAX_CHARS:]
+
+    max_tokens = _analysis_logs_token_budget()
+    # Токенизируем только хвост: больше max_tokens * _MAX_CHARS_PER_TOKEN символов в бюджет не поместится
+    tail = logs[-max_tokens * _MAX_CHARS_PER_TOKEN :]
+    token_ids = encoder.encode(tail, disallowed_special=())
+    if len(token_ids) <= max_tokens:
+        return tail
+    return encoder.decode(token_ids[-max_tokens:])
+
+
+def _get_log_compressor():
+    """Lazy initialization of the LLMLingua-2 compressor."""
+    global _log_compressor, _log_compressor_unavailable
+    if _log_compressor is None and not _log_compressor_unavailable:
+        try:
+            from llmlingua import PromptCompressor
+
+            _log_compressor = PromptCompressor(model_name=LOG_COMPRESSION_MODEL, use_llmlingua2=True, device_map="cpu")
+        except ImportError:
+            logger.warning("llmlingua package not installed, log compression disabled")
+            _log_compressor_unavailable = True
+        except Exception as e:
+            logger.warning(f"Failed to initialize log compressor: {e}")
+            _log_compressor_unavailable = True
+    return _log_compressor
+
+
+def _compress_logs(logs: str, target_ratio: float = LOG_COMPRESSION_RATE) -> str:
+    """Compress log text with LLMLingua-2, keeping severity keywords intact."""
+    compressor = _get_log_compressor()
+    if compressor is None:
+        return logs
+    try:
+        result = compressor.compress_prompt(logs, rate=target_ratio, force_tokens=_LOG_FORCE_TOKENS)
+        return result["compressed_prompt"]
+    except Exception as e:
+        logger.warning(f"Log compression failed, sending raw logs: {e}")
+        return logs
 
 
-async def _call_llm_with_fallback(messages: list, temperature: float = 0.1, max_tokens: int = 1024) -> str:
+async def _prepare_llm_input(text: str) -> str:
+    """Compress text for the LLM prompt if enabled (inference runs off the event loop)."""
+    if not LOG_COMPRESSION_ENABLED:
+        return text
+    return await asyncio.to_thread(_compress_logs, text)
+
+
+def _openai_p95_latency() -> float:
+    """95th percentile of recent OpenAI call durations (0 until the window has enough samples)."""
+    if len(_openai_latencies) < HEDGE_MIN_SAMPLES:
+        return 0.0
+    ordered = sorted(_openai_latencies)
+    return ordered[int(0.95 * (len(ordered) - 1))]
+
+
+def _should_hedge() -> bool:
+    """Hedge only while OpenAI is slow, so healthy traffic isn't billed twice."""
+    return _openai_p95_latency() > HEDGE_P95_THRESHOLD
+
+
+async def _call_openai(model: str, response_format: dict | None, **params) -> str:
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    # Only completed calls are recorded: breaker rejections and requests cancelled
+    # after losing the hedge race would skew the p95
+    try:
+        response = await openai_breaker.call(
+            openai_client.chat.completions.create,
+            model=model,
+            **params,
+            **({"response_format": response_format} if response_format else {}),
+        )
+    except CircuitBreakerOpenError:
+        raise
+    except Exception:
+        _openai_latencies.append(loop.time() - started)
+        raise
+    _openai_latencies.append(loop.time() - started)
+    return response.choices[0].message.content.strip()
+
+
+async def _call_ollama(ollama: AsyncOpenAI, response_format: dict | None, **params) -> str:
+    response = await ollama_breaker.call(
+        ollama.chat.completions.create,
+        model=OLLAMA_MODEL,
+        **params,
+        **({"response_format": _JSON_OBJECT_FORMAT} if response_format else {}),
+    )
+    logger.info("Successfully used Ollama fallback")
+    return response.choices[0].message.content.strip()
+
+
+async def _call_hedged(ollama: AsyncOpenAI, model: str, response_format: dict | None, **params) -> str:
+    """
+    Race OpenAI against a delayed Ollama request and return the first success.
+
+    Ollama is started after HEDGE_DELAY_MS (or as soon as OpenAI fails);
+    the losing request is cancelled. A losing OpenAI request made while the
+    breaker is HALF_OPEN may be its trial call, so it is left to finish in the
+    background and record the outcome instead.
+    """
+    openai_task = asyncio.create_task(_call_openai(model, response_format, **params))
+    pending = {openai_task}
+    hedge_started = False
+    last_error: BaseException | None = None
+    try:
+        while pending:
+            timeout = None if hedge_started else HEDGE_DELAY_MS / 1000
+            done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                last_error = task.exception()
+                logger.warning(f"Hedged LLM request failed: {last_error}")
+            if not hedge_started:
+                hedge_started = True
+                pending.add(asyncio.create_task(_call_ollama(ollama, response_format, **params)))
+        raise last_error
+    finally:
+        for task in pending:
+            if task is openai_task and openai_breaker.state == CircuitState.HALF_OPEN:
+                _openai_trials.add(task)
+                task.add_done_callback(_forget_trial)
+            else:
+                task.cancel()
+
+
+def _forget_trial(task: asyncio.Task) -> None:
+    _openai_trials.discard(task)
+    if not task.cancelled():
+        task.exception()  # исход уже учтен breaker'ом; не даем asyncio ругаться на неполученную ошибку
+
+
+async def _call_llm_with_fallback(
+    messages: list,
+    temperature: float = 0.1,
+    max_tokens: int = 1024,
+    model: str = DEFAULT_MODEL,
+    response_format: dict | None = None,
+) -> str:
     """
     Call LLM with automatic fallback from OpenAI to Ollama.
 
+    response_format is passed to OpenAI as is; Ollama gets plain JSON mode
+    whenever any response_format is requested. While OpenAI is recovering
+    or slow, Ollama is raced against it instead of waiting for a failure.
+
     Returns the response text or raises exception if all providers fail.
     """
+    params = {"messages": messages, "temperature": temperature, "max_tokens": max_tokens}
+    ollama = _get_ollama_client()
+
+    if ollama and _should_hedge():
+        return await _call_hedged(ollama, model, response_format, **params)
+
     last_error = None
 
     # Try OpenAI first
     try:
-        if not openai_breaker.is_open:
-            response = await openai_breaker.call(
-                openai_client.chat.completions.create,
-                model=DEFAULT_MODEL,
-                messages=messages,
-                temperature=temperature,
-                max_tokens=max_tokens,
-            )
-            return response.choices[0].message.content.strip()
+        return await _call_openai(model, response_format, **params)
     except CircuitBreakerOpenError:
         logger.warning("OpenAI circuit breaker is OPEN, trying fallback...")
     except Exception as e:
@@ -108,19 +606,9 @@ async def _call_llm_with_fallback(messages: list, temperature: float = 0.1, max_
         logger.warning(f"OpenAI call failed: {e}, trying Ollama fallback...")
 
     # Fallback to Ollama
-    ollama = _get_ollama_client()
     if ollama:
         try:
-            if not ollama_breaker.is_open:
-                response = await ollama_breaker.call(
-                    ollama.chat.completions.create,
-                    model=OLLAMA_MODEL,
-                    messages=messages,
-                    temperature=temperature,
-                    max_tokens=max_tokens,
-                )
-                logger.info("Successfully used Ollama fallback")
-                return response.choices[0].message.content.strip()
+            return await _call_ollama(ollama, response_format, **params)
         except CircuitBreakerOpenError:
             logger.error("Both OpenAI and Ollama circuit breakers are OPEN")
         except Exception as e:
@@ -133,6 +621,155 @@ async def _call_llm_with_fallback(messages: list, temperature: float = 0.1, max_
     raise RuntimeError("All LLM providers unavailable")
 
 
+# ==================== Analysis Batching ====================
+
+
+def _looks_trivial(logs: str) -> bool:
+    """Small INFO-only log chunks are cheap to classify."""
+    return len(logs) < TRIVIAL_LOGS_MAX_SIZE and not _NON_INFO_LOG_RE.search(logs)
+
+
+async def _request_analysis(logs: str, model: str = DEFAULT_MODEL) -> dict:
+    """Analyze a single log block; raises json.JSONDecodeError on a malformed reply."""
+    response_text = await _call_llm_with_fallback(
+        messages=[
+            {"role": "system", "content": _SYS_ANALYSIS},
+            {"role": "user", "content": _USER_ANALYSIS_TMPL.format(logs)},
+        ],
+        temperature=0.1,
+        max_tokens=1024,
+        model=model,
+        response_format=_ANALYSIS_RESPONSE_FORMAT,
+    )
+    return json.loads(_clean_json_response(response_text))
+
+
+async def _request_batch_analysis(blocks: list[str], model: str = DEFAULT_MODEL) -> list[dict]:
+    """Analyze several log blocks in one LLM call; raises ValueError if the reply doesn't match."""
+    parts = [_USER_BATCH_ANALYSIS_TMPL.format(len(blocks))]
+    parts.extend(f"[BLOCK {i}]\n{block}" for i, block in enumerate(blocks, 1))
+
+    response_text = await _call_llm_with_fallback(
+        messages=[{"role": "system", "content": _SYS_ANALYSIS}, {"role": "user", "content": "\n".join(parts)}],
+        temperature=0.1,
+        max_tokens=1024 * len(blocks),
+        model=model,
+        response_format=_BATCH_ANALYSIS_RESPONSE_FORMAT,
+    )
+    results = json.loads(_clean_json_response(response_text))
+    if isinstance(results, dict):
+        results = results.get("results")
+    if not isinstance(results, list) or len(results) != len(blocks) or not all(isinstance(r, dict) for r in results):
+        raise ValueError(f"Expected a JSON array of {len(blocks)} objects")
+    return results
+
+
+class AnalysisBatcher:
+    """
+    Объединяет одновременные запросы на анализ логов в один вызов LLM.
+
+    Запросы, пришедшие в течение max_wait_ms, собираются (до max_batch штук)
+    в одно user-сообщение с общим системным промптом. Если пакетный ответ не
+    удалось разобрать, блоки анализируются отдельными вызовами.
+    """
+
+    def __init__(
+        self, model: str = DEFAULT_MODEL, max_batch: int = ANALYSIS_BATCH_MAX, max_wait_ms: int = ANALYSIS_BATCH_WAIT_MS
+    ):
+        self.model = model
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self._queue: asyncio.Queue | None = None
+        self._worker: asyncio.Task | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._inflight: set[asyncio.Task] = set()
+
+    async def submit(self, logs: str) -> dict:
+        """Queue a log block for analysis and wait for its parsed JSON result."""
+        loop = asyncio.get_running_loop()
+        if self._worker is None or self._worker.done() or self._loop is not loop:
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.create_task(self._run())
+
+        future = loop.create_future()
+        self._queue.put_nowait((logs, future))
+        return await future
+
+    async def stop(self) -> None:
+        """Cancel the collector and in-flight batches; callers still waiting in submit() get CancelledError."""
+        if self._worker is not None and not self._worker.done():
+            self._worker.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._worker
+        self._worker = None
+
+        for task in list(self._inflight):
+            task.cancel()
+        await asyncio.gather(*self._inflight, return_exceptions=True)
+
+        if self._queue is not None:
+            while not self._queue.empty():
+                _, future = self._queue.get_nowait()
+                future.cancel()
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+            try:
+                while len(batch) < self.max_batch:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                    except asyncio.TimeoutError:
+                        break
+            except asyncio.CancelledError:
+                for _, future in batch:
+                    future.cancel()
+                raise
+
+            # Пока пакет обрабатывается, продолжаем собирать следующий
+            task = asyncio.create_task(self._process(batch))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+
+    async def _process(self, batch: list[tuple[str, asyncio.Future]]) -> None:
+        blocks = [logs for logs, _ in batch]
+        try:
+            if len(blocks) == 1:
+                results = [await _request_analysis(blocks[0], self.model)]
+            else:
+                try:
+                    results = await _request_batch_analysis(blocks, self.model)
+                except ValueError as e:
+                    logger.warning(f"Batch analysis reply unusable ({e}), analyzing {len(blocks)} blocks separately")
+                    results = await asyncio.gather(
+                        *(_request_analysis(b, self.model) for b in blocks), return_exceptions=True
+                    )
+        except asyncio.CancelledError:
+            for _, future in batch:
+                future.cancel()
+            raise
+        except Exception as e:
+            results = [e] * len(blocks)
+
+        for (_, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, BaseException):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+
+_analysis_batcher = AnalysisBatcher()
+_cheap_analysis_batcher = AnalysisBatcher(model=CHEAP_MODEL)
+
+
 # ==================== Main Functions ====================
 
 
@@ -143,92 +780,48 @@ async def analyze_logs_with_llm(logs: str) -> LogAnalysisResult:
     """
     logger.info("Отправка логов на анализ в LLM...")
 
-    # Generate cache key based on logs content
-    logs_hash = hashlib.md5(logs.encode()).hexdigest()[:16]
+    # Generate cache key based on deduplicated logs content; большие логи
+    # обрабатываем вне event loop, чтобы не блокировать другие запросы
+    if len(logs) > OFFLOAD_PREPARE_SIZE:
+        deduped_logs, logs_hash = await asyncio.to_thread(_prepare_logs, logs)
+    else:
+        deduped_logs, logs_hash = _prepare_logs(logs)
     cache_key = f"aiops:analysis:{logs_hash}"
 
     # Check cache
-    cached = await cache.get(cache_key)
+    cached = await _cache_get(cache_key)
     if cached:
         logger.info("Возвращаем закэшированный результат анализа")
-        return LogAnalysisResult(**cached)
-
-    system_prompt = """Ты — эксперт по анализу логов IT-инфраструктуры. Твоя задача — проанализировать предоставленные логи и выявить проблемы.
-
-Ты ДОЛЖЕН вернуть ответ ТОЛЬКО в формате JSON без дополнительного текста:
-{
-    "summary": "Краткое описание найденной проблемы",
-    "root_cause": "Наиболее вероятная первопричина проблемы",
-    "severity": "Low|Medium|High|Critical",
-    "relevant_logs": ["строка лога 1", "строка лога 2"]
-}
-
-Правила определения severity:
-- Critical: Сервис полностью недоступен, потеря данных
-- High: Серьезные ошибки, влияющие на работу пользователей
-- Medium: Предупреждения, потенциальные проблемы
-- Low: Информационные сообщения, незначительные ошибки"""
+        return LogAnalysisResult.from_trusted(cached)
 
-    user_prompt = f"""Проанализируй следующие логи и определи проблему:
+    logs_for_llm = await _prepare_llm_input(_truncate_logs(deduped_logs))
 
----
-{logs[:8000]}
----
+    try:
+        if CHEAP_MODEL != DEFAULT_MODEL and _looks_trivial(deduped_logs):
+            result_json = await _cheap_analysis_batcher.submit(logs_for_llm)
+            if str(result_json.get("severity", "")).lower() in _ESCALATE_SEVERITIES:
+                logger.info("Дешевая модель оценила проблему как серьезную, перепроверяем основной моделью")
+                result_json = await _analysis_batcher.submit(logs_for_llm)
+        else:
+            result_json = await _analysis_batcher.submit(logs_for_llm)
 
-Верни результат в формате JSON."""
+        cache_data = _normalize_analysis(result_json)
+        result = LogAnalysisResult(**cache_data)
 
-    try:
-        response_text = await _call_llm_with_fallback(
-            messages=[{"role": "system", "content": system_prompt}, {"role": "user", "content": user_prompt}],
-            temperature=0.1,
-            max_tokens=1024,
-        )
+        # Cache the result
+        await _cache_set(cache_key, cache_data, CACHE_TTL_ANALYSIS)
 
-        response_text = _clean_json_response(response_text)
+        logger.info(f"LLM успешно проанализировал логи. Причина: {result.root_cause}")
+        return result
 
-        try:
-            result_json = json.loads(response_text)
-
-            # Map severity to enum
-            severity_map = {
-                "low": SeverityLevel.LOW,
-                "medium": SeverityLevel.MEDIUM,
-                "high": SeverityLevel.HIGH,
-                "critical": SeverityLevel.CRITICAL,
-            }
-            severity_str = result_json.get("severity", "medium").lower()
-            result_json["severity"] = severity_map.get(severity_str, SeverityLevel.MEDIUM)
-
-            # Cache the result
-            cache_data = {
-                "summary": result_json.get("summary"),
-                "root_cause": result_json.get("root_cause"),
-                "severity": result_json["severity"].value,
-                "relevant_logs": result_json.get("relevant_logs", []),
-            }
-            await cache.set(cache_key, cache_data, CACHE_TTL_ANALYSIS)
-
-            logger.info(f"LLM успешно проанализировал логи. Причина: {result_json.get('root_cause')}")
-            return LogAnalysisResult(**result_json)
-
-        except json.JSONDecodeError as e:
-            logger.error(f"Ошибка декодирования JSON ответа от LLM: {e}")
-            return LogAnalysisResult(
-                summary="Не удалось распарсить ответ AI",
-                root_cause="Ошибка парсинга JSON",
-                severity=SeverityLevel.MEDIUM,
-                relevant_logs=[logs[:500]],
-            )
+    except json.JSONDecodeError as e:
+        logger.error(f"Ошибка декодирования JSON ответа от LLM: {e}")
+        return _degraded_analysis(logs, "Не удалось распарсить ответ AI", "Ошибка парсинга JSON")
 
     except Exception as e:
         logger.error(f"Исключение при вызове LLM: {e}")
         # Return degraded response instead of raising
-        return LogAnalysisResult(
-            summary="AI анализ временно недоступен",
-            root_cause=f"Ошибка LLM: {str(e)[:100]}",
-            severity=SeverityLevel.MEDIUM,
-            relevant_logs=[logs[:500]],
-        )
+        return _degraded_analysis(logs, "AI анализ временно недоступен", f"Ошибка LLM: {str(e)[:100]}")
 
 
 async def generate_remediation_plan(context: str) -> str:
@@ -238,42 +831,24 @@ async def generate_remediation_plan(context: str) -> str:
     """
     logger.info("Генерация Ansible плейбука с помощью LLM...")
 
-    # Generate cache key
-    context_hash = hashlib.md5(context.encode()).hexdigest()[:16]
+    # Generate cache key based on normalized context
+    context_hash = _cache_hash(_normalize_for_key(context))
     cache_key = f"aiops:playbook:{context_hash}"
 
     # Check cache
-    cached = await cache.get(cache_key)
+    cached = await _cache_get(cache_key)
     if cached:
         logger.info("Возвращаем закэшированный плейбук")
         return cached
 
-    system_prompt = """Ты — старший DevOps-инженер с опытом работы с Ansible.
-Твоя задача — создавать безопасные и эффективные Ansible плейбуки для исправления проблем в IT-инфраструктуре.
-
-Правила:
-1. Плейбук должен быть идемпотентным
-2. Включай проверки перед выполнением опасных операций
-3. Добавляй шаги верификации после исправления
-4. Используй become: yes только когда необходимо
-5. Добавляй комментарии на русском языке
-
-Верни ТОЛЬКО YAML-код плейбука без дополнительного текста и markdown-оберток."""
-
-    user_prompt = f"""На основе следующего контекста создай Ansible плейбук для исправления проблемы:
-
----
-{context[:4000]}
----
-
-Создай плейбук, который:
-1. Диагностирует текущее состояние
-2. Выполняет исправление
-3. Верифицирует результат"""
+    context_for_llm = await _prepare_llm_input(context[:4000])
 
     try:
         response_text = await _call_llm_with_fallback(
-            messages=[{"role": "system", "content": system_prompt}, {"role": "user", "content": user_prompt}],
+            messages=[
+                {"role": "system", "content": _SYS_PLAYBOOK},
+                {"role": "user", "content": _USER_PLAYBOOK_TMPL.format(context_for_llm)},
+            ],
             temperature=0.2,
             max_tokens=2048,
         )
@@ -281,7 +856,7 @@ async def generate_remediation_plan(context: str) -> str:
         playbook_yaml = _clean_yaml_response(response_text)
 
         # Cache the result
-        await cache.set(cache_key, playbook_yaml, CACHE_TTL_PLAYBOOK)
+        await _cache_set(cache_key, playbook_yaml, CACHE_TTL_PLAYBOOK)
 
         logger.info("LLM успешно сгенерировал плейбук.")
         return playbook_yaml
@@ -316,47 +891,49 @@ async def interpret_natural_language(query: str) -> dict:
     """
     logger.info(f"Интерпретация команды: {query}")
 
-    # Generate cache key
-    query_hash = hashlib.md5(query.lower().strip().encode()).hexdigest()[:16]
+    local_result = _match_local_command(query)
+    if local_result is not None:
+        logger.info(f"Интерпретировано локально: action={local_result['action']}, target={local_result['target']}")
+        return local_result
+
+    # Generate cache key (числа не отбрасываем: в команде это могут быть vmid)
+    query_hash = _cache_hash(_WHITESPACE_RE.sub(" ", query.lower()).strip())
     cache_key = f"aiops:nl:{query_hash}"
 
     # Check cache
-    cached = await cache.get(cache_key)
+    cached = await _cache_get(cache_key)
     if cached:
         logger.info("Возвращаем закэшированную интерпретацию")
         return cached
 
-    system_prompt = """Ты — интерпретатор команд для AIOps системы.
-Твоя задача — преобразовать команду пользователя на естественном языке в структурированное действие.
-
-Доступные действия:
-- get_status: Получить статус (target: "system" или имя сервиса)
-- analyze_service: Запустить анализ сервиса (target: имя сервиса)
-- run_playbook: Запустить плейбук (target: имя сервиса, parameters.playbook_name: имя плейбука)
-- get_logs: Получить логи (target: имя сервиса, parameters.time_window: период)
-- restart_service: Перезапустить сервис (target: имя сервиса)
-- list_vms: Список виртуальных машин
-- vm_action: Действие с VM (target: vmid, parameters.action: start|stop|reboot)
-
-Верни ТОЛЬКО JSON без дополнительного текста:
-{
-    "action": "название_действия",
-    "target": "цель_действия",
-    "parameters": {}
-}"""
+    # Каскад: сначала дешевая модель, основная - только если ответ не распознан
+    models = [CHEAP_MODEL] if CHEAP_MODEL == DEFAULT_MODEL else [CHEAP_MODEL, DEFAULT_MODEL]
 
     try:
-        response_text = await _call_llm_with_fallback(
-            messages=[{"role": "system", "content": system_prompt}, {"role": "user", "content": query}],
-            temperature=0.1,
-            max_tokens=256,
-        )
+        for model in models:
+            response_text = await _call_llm_with_fallback(
+                messages=[{"role": "system", "content": _SYS_NL}, {"role": "user", "content": query}],
+                temperature=0.1,
+                max_tokens=256,
+                model=model,
+                response_format=_JSON_OBJECT_FORMAT,
+            )
 
-        response_text = _clean_json_response(response_text)
-        result = json.loads(response_text)
+            try:
+                result = json.loads(_clean_json_response(response_text))
+            except json.JSONDecodeError:
+                if model == models[-1]:
+                    raise
+                logger.info(f"{model} вернул некорректный JSON, повторяем с {DEFAULT_MODEL}")
+                continue
+
+            if result.get("action") != "unknown":
+                break
+            if model != models[-1]:
+                logger.info(f"{model} не распознал команду, повторяем с {DEFAULT_MODEL}")
 
         # Cache the result
-        await cache.set(cache_key, result, CACHE_TTL_NL)
+        await _cache_set(cache_key, result, CACHE_TTL_NL)
 
         logger.info(f"Интерпретировано: action={result.get('action')}, target={result.get('target')}")
         return result
@@ -369,6 +946,20 @@ async def interpret_natural_language(query: str) -> dict:
         return {"action": "error", "target": None, "parameters": {"error": str(e)}}
 
 
+# ==================== Agent Client ====================
+
+
+class AIService:
+    """Chat-completion client for the conversational agent (uses the shared LLM clients and fallback)."""
+
+    async def generate_completion(
+        self, prompt: str, system_prompt: str | None = None, temperature: float = 0.3, max_tokens: int = 500
+    ) -> str:
+        messages = [{"role": "system", "content": system_prompt}] if system_prompt else []
+        messages.append({"role": "user", "content": prompt})
+        return await _call_llm_with_fallback(messages=messages, temperature=temperature, max_tokens=max_tokens)
+
+
 # ==================== Health Check ====================
 
 
@@ -378,6 +969,7 @@ async def get_llm_status() -> dict[str, Any]:
         "openai": {
             "circuit_breaker": openai_breaker.get_status(),
             "model": DEFAULT_MODEL,
+            "cheap_model": CHEAP_MODEL,
         },
         "ollama": {
             "circuit_breaker": ollama_breaker.get_status(),
@@ -9,14 +9,21 @@ Features:
 
 import asyncio
 import datetime
+import operator
+import re
 import uuid
+from functools import lru_cache
+from itertools import groupby, islice
 from typing import Any
 
 import aiohttp
+import orjson
 from elasticsearch import AsyncElasticsearch
 
 from app.models.schemas import ActionStatus, LogAnalysisResult, MetricsAnomalyResult, RemediationPlan, SeverityLevel
 from app.services import ai_service, automation_service, telegram_service
+from app.services.notification_queue import enqueue_message
+from app.utils.async_cache import async_ttl_cache
 from app.utils.circuit_breaker import (
     CircuitBreakerOpenError,
     elasticsearch_breaker,
@@ -28,35 +35,140 @@ from config.settings import settings
 from .system_service import get_plan_from_db, save_plan_to_db
 
 
+# Из ES запрашиваем только поля, которые используются при анализе;
+# больше LOGS_FETCH_SIZE записей в промпт все равно не попадает
+LOGS_FETCH_SIZE = 50
+LOG_SOURCE_FIELDS = ["@timestamp", "message", "log.level", "level", "severity", "service.name", "source"]
+
+# Повторные анализы одного сервиса во время шторма алертов переиспользуют
+# собранные данные (TTL задается в настройках); смена состояния circuit breaker сбрасывает кэш
+COLLECTION_CACHE_SIZE = 256
+
+# Верхняя граница ожидания параллельного сбора логов и метрик
+COLLECTION_TIMEOUT = 15  # seconds
+
+# Метка, которой помечаются подвыражения объединенного PromQL-запроса
+PROMQL_METRIC_LABEL = "aiops_metric"
+
+
+# Шаблоны PromQL-запросов: {s} - сервис, {w} - окно (фигурные скобки PromQL удвоены)
+_PROM_QUERY_TEMPLATES: dict[str, str] = {
+    "cpu_usage": 'avg(rate(container_cpu_usage_seconds_total{{container="{s}"}}[{w}])) * 100',
+    "memory_usage": 'avg(container_memory_usage_bytes{{container="{s}"}}) / 1024 / 1024',
+    "error_rate": 'sum(rate(http_requests_total{{service="{s}",status=~"5.."}}[{w}])) / sum(rate(http_requests_total{{service="{s}"}}[{w}])) * 100',
+    "request_latency": 'histogram_quantile(0.95, rate(http_request_duration_seconds_bucket{{service="{s}"}}[{w}]))',
+    "availability": 'avg_over_time(up{{job="{s}"}}[{w}]) * 100',
+}
+
+
+@lru_cache(maxsize=512)
+def _build_queries(service_name: str, time_window: str) -> tuple[tuple[str, str], ...]:
+    """Готовые PromQL-запросы (метрика, запрос) для сервиса и окна."""
+    return tuple((name, tmpl.format(s=service_name, w=time_window)) for name, tmpl in _PROM_QUERY_TEMPLATES.items())
+
+
+@lru_cache(maxsize=512)
+def _build_combined_query(service_name: str, time_window: str) -> str:
+    """
+    Все метрики одним выражением: каждое подвыражение помечается меткой
+    PROMQL_METRIC_LABEL через label_replace и объединяется оператором or.
+    """
+    return " or ".join(
+        f'label_replace({query}, "{PROMQL_METRIC_LABEL}", "{name}", "", "")'
+        for name, query in _build_queries(service_name, time_window)
+    )
+
+
+def _parse_hit(source: dict[str, Any], service_name: str) -> dict[str, Any]:
+    """Приводит документ ES к записи лога с гарантированными полями."""
+    get = source.get
+    return {
+        "timestamp": get("@timestamp") or "N/A",
+        "message": get("message") or "",
+        "level": (get("log") or {}).get("level") or get("level") or get("severity") or "unknown",
+        "service": (get("service") or {}).get("name") or service_name,
+        "source": get("source") or "",
+    }
+
+
+# Клиенты ES и Prometheus общие для процесса: TCP-соединения и DNS-кэш
+# переиспользуются любыми экземплярами DataCollector
+_es_client: AsyncElasticsearch | None = None
+_http_session: aiohttp.ClientSession | None = None
+
+# Ограничение одновременных запросов к каждому источнику, общее для всех анализов
+_es_semaphore = asyncio.Semaphore(settings.elasticsearch_max_inflight)
+_prometheus_semaphore = asyncio.Semaphore(settings.prometheus_max_inflight)
+
+
+def get_shared_es_client() -> AsyncElasticsearch:
+    """Возвращает общий клиент Elasticsearch, создавая его при первом вызове."""
+    global _es_client
+    if _es_client is None:
+        _es_client = AsyncElasticsearch(
+            hosts=[f"http://{settings.elasticsearch_host}:{settings.elasticsearch_port}"],
+            request_timeout=30,
+            connections_per_node=settings.elasticsearch_pool_size,
+            http_compress=True,
+            sniff_on_start=False,
+        )
+    return _es_client
+
+
+def get_shared_http_session() -> aiohttp.ClientSession:
+    """Возвращает общую HTTP сессию для Prometheus, создавая ее при необходимости."""
+    global _http_session
+    if _http_session is None or _http_session.closed:
+        connector = aiohttp.TCPConnector(
+            limit=settings.prometheus_pool_limit,
+            limit_per_host=settings.prometheus_pool_limit_per_host,
+            ttl_dns_cache=300,
+            keepalive_timeout=60,
+        )
+        _http_session = aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=10))
+    return _http_session
+
+
+async def close_shared_clients() -> None:
+    """Закрывает общие клиенты (вызывается при остановке приложения)."""
+    global _es_client, _http_session
+    if _es_client is not None:
+        await _es_client.close()
+        _es_client = None
+    if _http_session is not None and not _http_session.closed:
+        await _http_session.close()
+    _http_session = None
+
+
 class DataCollector:
     """Класс для параллельного сбора данных из различных источников."""
 
-    def __init__(self):
-        self.es_client: AsyncElasticsearch | None = None
-        self._http_session: aiohttp.ClientSession | None = None
-
     async def get_es_client(self) -> AsyncElasticsearch:
-        """Получает или создает клиент Elasticsearch."""
-        if self.es_client is None:
-            self.es_client = AsyncElasticsearch(
-                hosts=[f"http://{settings.elasticsearch_host}:{settings.elasticsearch_port}"], request_timeout=30
-            )
-        return self.es_client
+        """Получает общий клиент Elasticsearch."""
+        return get_shared_es_client()
 
     async def get_http_session(self) -> aiohttp.ClientSession:
-        """Получает или создает HTTP сессию для Prometheus."""
-        if self._http_session is None or self._http_session.closed:
-            self._http_session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=10))
-        return self._http_session
+        """Получает общую HTTP сессию для Prometheus."""
+        return get_shared_http_session()
+
+    async def probe_elasticsearch(self) -> None:
+        """Быстрая проверка доступности Elasticsearch для выхода circuit breaker из OPEN."""
+        es = await self.get_es_client()
+        health = await es.options(request_timeout=1).cluster.health(timeout="1s")
+        if health["status"] == "red":
+            raise ConnectionError("Elasticsearch cluster status is red")
+
+    async def probe_prometheus(self) -> None:
+        """Быстрая проверка доступности Prometheus для выхода circuit breaker из OPEN."""
+        session = await self.get_http_session()
+        url = f"{settings.prometheus_url}/-/healthy"
+        async with session.get(url, timeout=aiohttp.ClientTimeout(total=1)) as response:
+            if response.status != 200:
+                raise ConnectionError(f"Prometheus health check returned HTTP {response.status}")
 
     async def close(self):
         """Закрывает соединения."""
-        if self.es_client:
-            await self.es_client.close()
-            self.es_client = None
-        if self._http_session and not self._http_session.closed:
-            await self._http_session.close()
-            self._http_session = None
+        await close_shared_clients()
 
     async def collect_logs_from_elasticsearch(
         self, service_name: str, time_window: str = "15m", log_level: str = "error"
@@ -66,13 +178,8 @@ class DataCollector:
         """
         logger.info(f"Сбор логов из Elasticsearch для {service_name} за {time_window}...")
 
-        # Check circuit breaker
-        if elasticsearch_breaker.is_open:
-            logger.warning("Elasticsearch circuit breaker is OPEN, returning empty logs")
-            return []
-
         try:
-            return await elasticsearch_breaker.call(self._collect_logs_internal, service_name, time_window, log_level)
+            return await self._collect_logs_cached(service_name, time_window, log_level)
         except CircuitBreakerOpenError:
             logger.warning("Elasticsearch circuit breaker triggered")
             return []
@@ -80,6 +187,16 @@ class DataCollector:
             logger.error(f"Ошибка при сборе логов: {e}")
             return []
 
+    # Кэш стоит снаружи breaker: попадание в кэш не обращается к ES и не должно
+    # засчитываться breaker'у как успешный запрос (иначе он закроется при лежащем ES)
+    @async_ttl_cache(
+        ttl=settings.elasticsearch_cache_ttl,
+        maxsize=COLLECTION_CACHE_SIZE,
+        key_extra=lambda: elasticsearch_breaker.state,
+    )
+    async def _collect_logs_cached(self, service_name: str, time_window: str, log_level: str) -> list[dict[str, Any]]:
+        return await elasticsearch_breaker.call(self._collect_logs_internal, service_name, time_window, log_level)
+
     async def _collect_logs_internal(self, service_name: str, time_window: str, log_level: str) -> list[dict[str, Any]]:
         """Internal method for log collection."""
         es = await self.get_es_client()
@@ -119,36 +236,20 @@ class DataCollector:
                 }
             )
 
-        logs = []
-        for index_pattern in index_patterns:
-            try:
-                response = await es.search(
-                    index=index_pattern,
-                    query=query,
-                    size=100,
-                    sort=[{"@timestamp": {"order": "desc"}}],
-                    ignore_unavailable=True,
-                )
+        # Один запрос по всем шаблонам: координатор ES опрашивает индексы параллельно
+        # и сортирует попадания по времени, отсутствующие индексы пропускаются
+        async with _es_semaphore:
+            response = await es.search(
+                index=",".join(index_patterns),
+                query=query,
+                size=LOGS_FETCH_SIZE,
+                source=LOG_SOURCE_FIELDS,
+                sort=[{"@timestamp": {"order": "desc"}}],
+                ignore_unavailable=True,
+                allow_no_indices=True,
+            )
 
-                for hit in response["hits"]["hits"]:
-                    source = hit["_source"]
-                    logs.append(
-                        {
-                            "timestamp": source.get("@timestamp"),
-                            "message": source.get("message", ""),
-                            "level": source.get("log", {}).get("level") or source.get("level", "unknown"),
-                            "service": source.get("service", {}).get("name") or service_name,
-                            "source": source.get("source", ""),
-                            "raw": source,
-                        }
-                    )
-
-                if logs:
-                    break
-
-            except Exception as e:
-                logger.debug(f"Индекс {index_pattern} не найден или ошибка: {e}")
-                continue
+        logs = [_parse_hit(hit["_source"], service_name) for hit in response["hits"]["hits"]]
 
         logger.info(f"Собрано {len(logs)} записей логов для {service_name}")
         return logs
@@ -167,13 +268,8 @@ class DataCollector:
             "availability": None,
         }
 
-        # Check circuit breaker
-        if prometheus_breaker.is_open:
-            logger.warning("Prometheus circuit breaker is OPEN, returning empty metrics")
-            return metrics
-
         try:
-            return await prometheus_breaker.call(self._collect_metrics_internal, service_name, time_window)
+            return await self._collect_metrics_cached(service_name, time_window)
         except CircuitBreakerOpenError:
             logger.warning("Prometheus circuit breaker triggered")
             return metrics
@@ -181,6 +277,15 @@ class DataCollector:
             logger.error(f"Ошибка при сборе метрик: {e}")
             return metrics
 
+    # Как и для логов, кэш проверяется до входа в breaker
+    @async_ttl_cache(
+        ttl=settings.prometheus_cache_ttl,
+        maxsize=COLLECTION_CACHE_SIZE,
+        key_extra=lambda: prometheus_breaker.state,
+    )
+    async def _collect_metrics_cached(self, service_name: str, time_window: str) -> dict[str, Any]:
+        return await prometheus_breaker.call(self._collect_metrics_internal, service_name, time_window)
+
     async def _collect_metrics_internal(self, service_name: str, time_window: str) -> dict[str, Any]:
         """Internal method for metrics collection."""
         metrics = {
@@ -191,44 +296,65 @@ class DataCollector:
             "availability": None,
         }
 
-        queries = {
-            "cpu_usage": f'avg(rate(container_cpu_usage_seconds_total{{container="{service_name}"}}[{time_window}])) * 100',
-            "memory_usage": f'avg(container_memory_usage_bytes{{container="{service_name}"}}) / 1024 / 1024',
-            "error_rate": f'sum(rate(http_requests_total{{service="{service_name}",status=~"5.."}}[{time_window}])) / sum(rate(http_requests_total{{service="{service_name}"}}[{time_window}])) * 100',
-            "request_latency": f'histogram_quantile(0.95, rate(http_request_duration_seconds_bucket{{service="{service_name}"}}[{time_window}]))',
-            "availability": f'avg_over_time(up{{job="{service_name}"}}[{time_window}]) * 100',
-        }
+        queries = _build_queries(service_name, time_window)
 
         session = await self.get_http_session()
+        url = f"{settings.prometheus_url}/api/v1/query"
 
-        # Параллельный сбор всех метрик
+        # Все метрики одним запросом (см. _build_combined_query)
+        combined = _build_combined_query(service_name, time_window)
+        try:
+            async with _prometheus_semaphore, session.post(url, data={"query": combined}) as response:
+                if response.status == 200:
+                    data = orjson.loads(await response.read())
+                    if data["status"] == "success":
+                        for series in data["data"]["result"]:
+                            metric_name = series["metric"].get(PROMQL_METRIC_LABEL)
+                            if metric_name in metrics and metrics[metric_name] is None:
+                                metrics[metric_name] = round(float(series["value"][1]), 2)
+                        logger.info(f"Собраны метрики для {service_name}: {metrics}")
+                        return metrics
+                logger.debug(f"Объединенный PromQL-запрос не выполнен (HTTP {response.status})")
+        except Exception as e:
+            logger.debug(f"Объединенный PromQL-запрос не выполнен: {e}")
+
+        # Резервный путь: отдельные запросы параллельно
         async def fetch_metric(metric_name: str, query: str) -> tuple:
-            try:
-                url = f"{settings.prometheus_url}/api/v1/query"
-                params = {"query": query}
-
-                async with session.get(url, params=params) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        if data["status"] == "success" and data["data"]["result"]:
-                            value = float(data["data"]["result"][0]["value"][1])
-                            return (metric_name, round(value, 2))
-            except Exception as e:
-                logger.debug(f"Не удалось получить метрику {metric_name}: {e}")
+            async with _prometheus_semaphore, session.get(url, params={"query": query}) as response:
+                if response.status == 200:
+                    data = orjson.loads(await response.read())
+                    if data["status"] == "success" and data["data"]["result"]:
+                        value = float(data["data"]["result"][0]["value"][1])
+                        return (metric_name, round(value, 2))
             return (metric_name, None)
 
         # Запускаем все запросы параллельно
-        tasks = [fetch_metric(name, query) for name, query in queries.items()]
+        tasks = [fetch_metric(name, query) for name, query in queries]
         results = await asyncio.gather(*tasks, return_exceptions=True)
 
-        for result in results:
-            if isinstance(result, tuple):
-                metric_name, value = result
-                metrics[metric_name] = value
+        errors = []
+        for (metric_name, _), result in zip(queries, results):
+            if isinstance(result, Exception):
+                logger.debug(f"Не удалось получить метрику {metric_name}: {result}")
+                errors.append(result)
+            else:
+                metrics[metric_name] = result[1]
+
+        # Prometheus недоступен целиком: пробрасываем ошибку, чтобы ее учел circuit breaker
+        if len(errors) == len(results):
+            raise errors[0]
 
         logger.info(f"Собраны метрики для {service_name}: {metrics}")
         return metrics
 
+    @staticmethod
+    def _task_result(task: asyncio.Task, what: str, default: Any) -> Any:
+        """Результат задачи сбора или default, если она не уложилась в COLLECTION_TIMEOUT."""
+        if task.cancelled() or not task.done():
+            logger.error(f"Сбор {what} не завершился за {COLLECTION_TIMEOUT}с")
+            return default
+        return task.result()
+
     async def collect_all_data_parallel(self, service_name: str, time_window: str = "15m") -> dict[str, Any]:
         """
         Параллельный сбор всех данных (логи + метрики).
@@ -242,27 +368,71 @@ class DataCollector:
         logs_task = asyncio.create_task(self.collect_logs_from_elasticsearch(service_name, time_window))
         metrics_task = asyncio.create_task(self.collect_metrics_from_prometheus(service_name, time_window))
 
-        # Ждем завершения обоих задач
-        logs, metrics = await asyncio.gather(logs_task, metrics_task, return_exceptions=True)
+        # Ждем оба источника, но не дольше COLLECTION_TIMEOUT. Коллекторы сами
+        # перехватывают ошибки и возвращают пустой результат, поэтому ждем только таймаут
+        _, pending = await asyncio.wait({logs_task, metrics_task}, timeout=COLLECTION_TIMEOUT)
+        for task in pending:
+            task.cancel()
 
-        # Обрабатываем возможные исключения
-        if isinstance(logs, Exception):
-            logger.error(f"Ошибка сбора логов: {logs}")
-            logs = []
-        if isinstance(metrics, Exception):
-            logger.error(f"Ошибка сбора метрик: {metrics}")
-            metrics = {}
+        logs = self._task_result(logs_task, "логов", [])
+        metrics = self._task_result(metrics_task, "метрик", {})
 
         return {"logs": logs, "metrics": metrics, "collected_at": datetime.datetime.now().isoformat()}
 
 
 # Глобальный экземпляр коллектора данных
 data_collector = DataCollector()
+elasticsearch_breaker.set_probe(data_collector.probe_elasticsearch)
+prometheus_breaker.set_probe(data_collector.probe_prometheus)
 
 
 # ==================== Alertmanager Webhook Handler ====================
 
 
+ALERT_SEVERITY_MAP = {
+    "critical": SeverityLevel.CRITICAL,
+    "high": SeverityLevel.HIGH,
+    "warning": SeverityLevel.MEDIUM,
+    "info": SeverityLevel.LOW,
+}
+
+# Telegram ограничивает сообщение 4096 символами, оставляем запас под разметку
+ALERT_MESSAGE_MAX_CHARS = 3500
+
+
+def _format_alert_group(header: str, lines: list[str]) -> str:
+    """Собирает сообщение по группе алертов, обрезая список до лимита Telegram."""
+    message = header
+    for i, line in enumerate(lines):
+        more = f"\n…+{len(lines) - i} more"
+        if len(message) + 1 + len(line) + len(more) > ALERT_MESSAGE_MAX_CHARS:
+            return message + more
+        message += "\n" + line
+    return message
+
+
+# Запущенные из webhook анализы: не более одного одновременно на сервис
+_inflight_analyses: dict[str, asyncio.Task] = {}
+
+
+def _spawn_full_analysis(service: str, time_window: str) -> asyncio.Task:
+    """Запускает полный анализ сервиса, если он еще не выполняется."""
+    task = _inflight_analyses.get(service)
+    if task is not None and not task.done():
+        logger.info(f"Анализ для {service} уже выполняется, повторный запуск пропущен")
+        return task
+
+    task = asyncio.create_task(trigger_full_analysis(service, time_window))
+    _inflight_analyses[service] = task
+
+    def _forget(done: asyncio.Task) -> None:
+        if _inflight_analyses.get(service) is done:
+            del _inflight_analyses[service]
+
+    task.add_done_callback(_forget)
+    return task
+
+
 async def handle_alertmanager_webhook(payload: dict[str, Any]) -> dict[str, Any]:
     """
     Обработчик webhook от Alertmanager (push-модель).
@@ -278,57 +448,67 @@ async def handle_alertmanager_webhook(payload: dict[str, Any]) -> dict[str, Any]
     alerts = payload.get("alerts", [])
     processed = []
 
+    # Проход 1: группируем алерты по сервису, чтобы при шторме алертов
+    # отправлять одно сообщение на сервис вместо одного на алерт
+    firing_by_service: dict[str, list[dict[str, Any]]] = {}
+    resolved_by_service: dict[str, list[dict[str, Any]]] = {}
+
     for alert in alerts:
-        alert_name = alert.get("labels", {}).get("alertname", "unknown")
-        service = alert.get("labels", {}).get("service") or alert.get("labels", {}).get("job", "unknown")
+        labels = alert.get("labels", {})
+        service = labels.get("service") or labels.get("job", "unknown")
         status = alert.get("status", "unknown")
-        severity = alert.get("labels", {}).get("severity", "warning")
-        description = alert.get("annotations", {}).get("description", "")
-
-        logger.info(f"Обработка алерта: {alert_name} для {service} ({status})")
 
         if status == "firing":
-            # Алерт активен - запускаем анализ
-            try:
-                # Определяем severity
-                severity_map = {
-                    "critical": SeverityLevel.CRITICAL,
-                    "high": SeverityLevel.HIGH,
-                    "warning": SeverityLevel.MEDIUM,
-                    "info": SeverityLevel.LOW,
-                }
-                sev = severity_map.get(severity.lower(), SeverityLevel.MEDIUM)
-
-                # Отправляем уведомление
-                await telegram_service.send_message(
-                    f"🚨 *Alertmanager*: {alert_name}\n"
-                    f"Сервис: {service}\n"
-                    f"Severity: {severity}\n"
-                    f"Описание: {description[:200]}"
-                )
+            firing_by_service.setdefault(service, []).append(alert)
+        elif status == "resolved":
+            resolved_by_service.setdefault(service, []).append(alert)
 
-                # Для критических алертов запускаем полный анализ
-                if sev in [SeverityLevel.CRITICAL, SeverityLevel.HIGH]:
-                    asyncio.create_task(trigger_full_analysis(service, "15m"))
-
-                processed.append(
-                    {
-                        "alert": alert_name,
-                        "service": service,
-                        "action": (
-                            "analysis_triggered" if sev in [SeverityLevel.CRITICAL, SeverityLevel.HIGH] else "notified"
-                        ),
-                    }
-                )
+    # Проход 2: одно сообщение и не более одного анализа на сервис
+    for service, service_alerts in firing_by_service.items():
+        logger.info(f"Обработка {len(service_alerts)} алертов для {service} (firing)")
+        try:
+            lines = []
+            needs_analysis = False
+            for alert in service_alerts:
+                alert_name = alert.get("labels", {}).get("alertname", "unknown")
+                severity = alert.get("labels", {}).get("severity", "warning")
+                description = alert.get("annotations", {}).get("description", "")
+                sev = ALERT_SEVERITY_MAP.get(severity.lower(), SeverityLevel.MEDIUM)
+                needs_analysis = needs_analysis or sev in (SeverityLevel.CRITICAL, SeverityLevel.HIGH)
+
+                line = f"• {alert_name} ({severity})"
+                if description:
+                    line += f": {description[:200]}"
+                lines.append(line)
+
+            enqueue_message(
+                _format_alert_group(f"🚨 *Alertmanager* — {service}: {len(service_alerts)} алертов", lines)
+            )
 
-            except Exception as e:
-                logger.error(f"Ошибка обработки алерта {alert_name}: {e}")
-                processed.append({"alert": alert_name, "error": str(e)})
+            # Для критических алертов запускаем полный анализ
+            if needs_analysis:
+                _spawn_full_analysis(service, "15m")
 
-        elif status == "resolved":
-            # Алерт разрешен
-            await telegram_service.send_message(f"✅ *Resolved*: {alert_name}\n" f"Сервис: {service}")
-            processed.append({"alert": alert_name, "service": service, "action": "resolved_notified"})
+            action = "analysis_triggered" if needs_analysis else "notified"
+            processed.extend(
+                {"alert": alert.get("labels", {}).get("alertname", "unknown"), "service": service, "action": action}
+                for alert in service_alerts
+            )
+
+        except Exception as e:
+            logger.error(f"Ошибка обработки алертов для {service}: {e}")
+            processed.extend(
+                {"alert": alert.get("labels", {}).get("alertname", "unknown"), "error": str(e)}
+                for alert in service_alerts
+            )
+
+    for service, service_alerts in resolved_by_service.items():
+        # Алерты разрешены
+        names = [alert.get("labels", {}).get("alertname", "unknown") for alert in service_alerts]
+        enqueue_message(
+            _format_alert_group(f"✅ *Resolved* — {service}: {len(service_alerts)} алертов", [f"• {n}" for n in names])
+        )
+        processed.extend({"alert": name, "service": service, "action": "resolved_notified"} for name in names)
 
     return {"status": "processed", "alerts_count": len(alerts), "processed": processed}
 
@@ -336,6 +516,39 @@ async def handle_alertmanager_webhook(payload: dict[str, Any]) -> dict[str, Any]
 # ==================== Analysis Functions ====================
 
 
+# Bulkhead: ограничиваем число одновременных вызовов LLM, чтобы шторм алертов
+# не исчерпал лимиты LLM API
+MAX_CONCURRENT_LLM_CALLS = 2
+_llm_semaphore = asyncio.Semaphore(MAX_CONCURRENT_LLM_CALLS)
+
+
+async def _call_llm(func, *args):
+    """Вызывает функцию ai_service, дожидаясь свободного слота LLM."""
+    async with _llm_semaphore:
+        return await func(*args)
+
+
+# Ограничения на объем логов в промпте анализа
+ANALYSIS_MAX_LOG_LINES = 50
+ANALYSIS_LOGS_MAX_CHARS = 8000
+
+
+def _format_logs_for_llm(logs: list[dict[str, Any]]) -> str:
+    """
+    Форматирует логи для промпта: не более ANALYSIS_MAX_LOG_LINES записей
+    и ANALYSIS_LOGS_MAX_CHARS символов (логи отсортированы от новых к старым).
+    """
+    lines = []
+    size = 0
+    for log in islice(logs, ANALYSIS_MAX_LOG_LINES):
+        line = f"[{log['timestamp']}] [{log['level']}] {log['message']}"
+        size += len(line) + 1
+        if size > ANALYSIS_LOGS_MAX_CHARS and lines:
+            break
+        lines.append(line)
+    return "\n".join(lines)
+
+
 async def analyze_logs(service_name: str, time_window: str) -> LogAnalysisResult:
     """
     Анализ логов для сервиса с использованием реальных данных.
@@ -343,23 +556,42 @@ async def analyze_logs(service_name: str, time_window: str) -> LogAnalysisResult
     logger.info(f"Анализ логов для {service_name} за {time_window}...")
 
     logs = await data_collector.collect_logs_from_elasticsearch(service_name, time_window)
+    return await analyze_logs_from(service_name, logs)
+
 
+async def analyze_logs_from(service_name: str, logs: list[dict[str, Any]]) -> LogAnalysisResult:
+    """
+    Анализ уже собранных логов (без повторного запроса к Elasticsearch).
+    """
     if not logs:
         logger.info(f"Логи для {service_name} не найдены")
         return LogAnalysisResult(
             summary="Логи не найдены", root_cause="Нет данных для анализа", severity=SeverityLevel.LOW, relevant_logs=[]
         )
 
-    logs_text = "\n".join(
-        [f"[{log.get('timestamp', 'N/A')}] [{log.get('level', 'N/A')}] {log.get('message', '')}" for log in logs[:50]]
-    )
+    logs_text = _format_logs_for_llm(logs)
 
-    analysis_result = await ai_service.analyze_logs_with_llm(logs_text)
+    analysis_result = await _call_llm(ai_service.analyze_logs_with_llm, logs_text)
     logger.info(f"Результат анализа логов: {analysis_result.summary}")
 
     return analysis_result
 
 
+# Пороговые правила анализа метрик: (метрика, сравнение, порог, оценка, описание, критический уровень)
+METRIC_RULES = (
+    ("cpu_usage", operator.gt, 90, 0.95, "Критическая загрузка CPU", True),
+    ("cpu_usage", operator.gt, 80, 0.8, "Высокая загрузка CPU", False),
+    ("memory_usage", operator.gt, 90, 0.95, "Критическое использование памяти", True),
+    ("memory_usage", operator.gt, 80, 0.75, "Высокое использование памяти", False),
+    ("error_rate", operator.gt, 10, 0.98, "Высокий уровень ошибок", True),
+    ("error_rate", operator.gt, 5, 0.85, "Повышенный уровень ошибок", False),
+    ("availability", operator.lt, 99, 0.9, "Низкая доступность", False),
+)
+
+# Основная метрика результата выбирается среди сработавших критических правил
+PRIMARY_METRIC_PRIORITY = ("error_rate", "cpu_usage", "memory_usage")
+
+
 async def analyze_metrics(service_name: str, time_window: str) -> MetricsAnomalyResult:
     """
     Анализ метрик для сервиса с использованием реальных данных.
@@ -367,50 +599,32 @@ async def analyze_metrics(service_name: str, time_window: str) -> MetricsAnomaly
     logger.info(f"Анализ метрик для {service_name} за {time_window}...")
 
     metrics = await data_collector.collect_metrics_from_prometheus(service_name, time_window)
+    return analyze_metrics_from(service_name, metrics)
+
 
+def analyze_metrics_from(service_name: str, metrics: dict[str, Any]) -> MetricsAnomalyResult:
+    """
+    Анализ уже собранных метрик (без повторного запроса к Prometheus).
+    """
     anomaly_score = 0.0
     anomaly_description = []
-    primary_metric = "system"
-    primary_value = 0.0
-
-    # Проверка CPU
-    if metrics["cpu_usage"] is not None:
-        if metrics["cpu_usage"] > 90:
-            anomaly_score = max(anomaly_score, 0.95)
-            anomaly_description.append(f"Критическая загрузка CPU: {metrics['cpu_usage']}%")
-            primary_metric = "cpu_usage"
-            primary_value = metrics["cpu_usage"]
-        elif metrics["cpu_usage"] > 80:
-            anomaly_score = max(anomaly_score, 0.8)
-            anomaly_description.append(f"Высокая загрузка CPU: {metrics['cpu_usage']}%")
-
-    # Проверка памяти
-    if metrics["memory_usage"] is not None:
-        if metrics["memory_usage"] > 90:
-            anomaly_score = max(anomaly_score, 0.95)
-            anomaly_description.append(f"Критическое использование памяти: {metrics['memory_usage']}%")
-            if primary_metric == "system":
-                primary_metric = "memory_usage"
-                primary_value = metrics["memory_usage"]
-        elif metrics["memory_usage"] > 80:
-            anomaly_score = max(anomaly_score, 0.75)
-            anomaly_description.append(f"Высокое использование памяти: {metrics['memory_usage']}%")
-
-    # Проверка error rate
-    if metrics["error_rate"] is not None:
-        if metrics["error_rate"] > 10:
-            anomaly_score = max(anomaly_score, 0.98)
-            anomaly_description.append(f"Высокий уровень ошибок: {metrics['error_rate']}%")
-            primary_metric = "error_rate"
-            primary_value = metrics["error_rate"]
-        elif metrics["error_rate"] > 5:
-            anomaly_score = max(anomaly_score, 0.85)
-            anomaly_description.append(f"Повышенный уровень ошибок: {metrics['error_rate']}%")
-
-    # Проверка доступности
-    if metrics["availability"] is not None and metrics["availability"] < 99:
-        anomaly_score = max(anomaly_score, 0.9)
-        anomaly_description.append(f"Низкая доступность: {metrics['availability']}%")
+    critical_metrics = set()
+    checked_metrics = set()
+
+    # Правила отсортированы так, что для каждой метрики критический уровень
+    # проверяется раньше предупреждения; сработать может один уровень на метрику
+    for metric, compare, threshold, score, label, critical in METRIC_RULES:
+        value = metrics.get(metric)
+        if value is None or metric in checked_metrics or not compare(value, threshold):
+            continue
+        checked_metrics.add(metric)
+        anomaly_score = max(anomaly_score, score)
+        anomaly_description.append(f"{label}: {value}%")
+        if critical:
+            critical_metrics.add(metric)
+
+    primary_metric = next((m for m in PRIMARY_METRIC_PRIORITY if m in critical_metrics), "system")
+    primary_value = metrics[primary_metric] if primary_metric != "system" else 0.0
 
     if all(v is None for v in metrics.values()):
         logger.warning(f"Метрики для {service_name} не найдены")
@@ -429,6 +643,25 @@ async def analyze_metrics(service_name: str, time_window: str) -> MetricsAnomaly
     )
 
 
+# Ограничения на объем контекста для генерации плана
+PLAN_LOGS_MAX_CHARS = 1500
+PLAN_CONTEXT_MAX_CHARS = 3000
+_LOG_PREFIX_RE = re.compile(r"^\[[^\]]+\]\s*")
+
+
+def _condense_logs(lines: list[str], max_chars: int = PLAN_LOGS_MAX_CHARS) -> str:
+    """
+    Сжимает логи для промпта плана: убирает ведущую метку времени,
+    схлопывает подряд идущие повторы в "×N строка" и обрезает до max_chars.
+    """
+    stripped = (_LOG_PREFIX_RE.sub("", line, count=1) for line in lines)
+    condensed = []
+    for line, group in groupby(stripped):
+        count = sum(1 for _ in group)
+        condensed.append(f"×{count} {line}" if count > 1 else line)
+    return "\n".join(condensed)[:max_chars]
+
+
 async def generate_remediation_plan(
     log_result: LogAnalysisResult, metrics_result: MetricsAnomalyResult
 ) -> RemediationPlan:
@@ -451,10 +684,10 @@ async def generate_remediation_plan(
 - Первопричина: {log_result.root_cause}
 - Уровень критичности: {log_result.severity}
 - Релевантные логи:
-{chr(10).join(log_result.relevant_logs[:5]) if log_result.relevant_logs else 'Нет данных'}
-"""
+{_condense_logs(log_result.relevant_logs[:5]) if log_result.relevant_logs else 'Нет данных'}
+"""[:PLAN_CONTEXT_MAX_CHARS]
 
-    playbook_yaml = await ai_service.generate_remediation_plan(context)
+    playbook_yaml = await _call_llm(ai_service.generate_remediation_plan, context)
 
     plan = RemediationPlan(
         plan_id=str(uuid.uuid4()),
@@ -471,46 +704,57 @@ async def generate_remediation_plan(
     return plan
 
 
+# Bulkhead: ограничиваем число одновременных анализов, чтобы шторм алертов
+# не исчерпал соединения к ES/Prometheus
+MAX_CONCURRENT_ANALYSES = 4
+_analysis_semaphore = asyncio.Semaphore(MAX_CONCURRENT_ANALYSES)
+
+
 async def trigger_full_analysis(service_name: str, time_window: str = "15m"):
     """
     Запускает полный цикл анализа для сервиса с параллельным сбором данных.
     """
+    async with _analysis_semaphore:
+        await _run_full_analysis(service_name, time_window)
+
+
+async def _run_full_analysis(service_name: str, time_window: str) -> None:
     try:
-        # Параллельный сбор всех данных
-        await data_collector.collect_all_data_parallel(service_name, time_window)
+        # Параллельный сбор всех данных; дальше анализируем их без повторных запросов
+        all_data = await data_collector.collect_all_data_parallel(service_name, time_window)
 
         # Анализ метрик
-        metrics_anomaly = await analyze_metrics(service_name, time_window)
+        metrics_anomaly = analyze_metrics_from(service_name, all_data["metrics"])
 
         if metrics_anomaly.anomaly_score > 0.7:
-            await telegram_service.send_message(
+            enqueue_message(
                 f"⚠️ Обнаружена аномалия в метриках *{service_name}*:\n{metrics_anomaly.description}"
             )
 
             # Анализ логов
-            log_analysis = await analyze_logs(service_name, time_window)
+            log_analysis = await analyze_logs_from(service_name, all_data["logs"])
 
             # Генерация плана
             if log_analysis.severity in [SeverityLevel.HIGH, SeverityLevel.CRITICAL]:
                 remediation_plan = await generate_remediation_plan(log_analysis, metrics_anomaly)
                 await telegram_service.send_approval_request(remediation_plan)
             else:
-                await telegram_service.send_message(
+                enqueue_message(
                     f"ℹ️ Проблема в *{service_name}* не требует немедленного вмешательства.\n"
                     f"Уровень: {log_analysis.severity.value}\n"
                     f"Описание: {log_analysis.summary}"
                 )
         elif metrics_anomaly.anomaly_score > 0.5:
-            await telegram_service.send_message(
+            enqueue_message(
                 f"📊 Обнаружены отклонения в метриках *{service_name}*:\n{metrics_anomaly.description}\n\n"
                 f"Рекомендуется мониторинг ситуации."
             )
         else:
-            await telegram_service.send_message(f"✅ Анализ для *{service_name}* завершен.\nАномалий не обнаружено.")
+            enqueue_message(f"✅ Анализ для *{service_name}* завершен.\nАномалий не обнаружено.")
 
     except Exception as e:
         logger.error(f"Ошибка при полном анализе сервиса {service_name}: {e}", exc_info=True)
-        await telegram_service.send_message(f"❌ Ошибка при анализе сервиса *{service_name}*:\n`{str(e)[:200]}`")
+        enqueue_message(f"❌ Ошибка при анализе сервиса *{service_name}*:\n`{str(e)[:200]}`")
 
 
 async def process_approval(plan_id: str, approved: bool, reason: str = None) -> str:
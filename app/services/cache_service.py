@@ -10,14 +10,20 @@ Features:
 
 import asyncio
 import hashlib
-import json
 from collections.abc import Callable
 from functools import wraps
 from typing import Any
 
+import orjson
+from fastapi import Response
+from pydantic import BaseModel
+
 from app.utils.logger import logger
 from config.settings import settings
 
+# Нестроковые ключи словарей сериализуются как строки, как в json.dumps
+ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS
+
 # Lazy import redis
 redis_client = None
 Redis = None
@@ -55,14 +61,62 @@ def _get_redis():
 
 def generate_cache_key(prefix: str, *args, **kwargs) -> str:
     """Generate a unique cache key from arguments."""
-    key_data = json.dumps(
-        {"args": [str(a) for a in args], "kwargs": {k: str(v) for k, v in sorted(kwargs.items())}}, sort_keys=True
+    key_data = orjson.dumps(
+        {"args": [str(a) for a in args], "kwargs": {k: str(v) for k, v in kwargs.items()}}, option=orjson.OPT_SORT_KEYS
     )
 
-    hash_value = hashlib.md5(key_data.encode()).hexdigest()[:16]
+    hash_value = hashlib.md5(key_data).hexdigest()[:16]
     return f"aiops:{prefix}:{hash_value}"
 
 
+def redis_memoize(ttl: int = 5, key_prefix: str = "memo"):
+    """
+    Decorator for short-lived memoization of endpoint responses in Redis.
+
+    The serialized JSON bytes are cached, so a hit skips both the wrapped
+    call and response encoding. Without Redis the function is called directly.
+
+    Usage:
+        @app.get("/status")
+        @redis_memoize(ttl=5, key_prefix="status:v1")
+        async def get_status():
+            ...
+    """
+
+    def decorator(func: Callable):
+        cache_key = f"aiops:{key_prefix}:{func.__name__}"
+
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            client = _get_redis()
+
+            if client:
+                try:
+                    cached_body = await client.get(cache_key)
+                    if cached_body is not None:
+                        return Response(content=cached_body, media_type="application/json")
+                except Exception as e:
+                    logger.warning(f"Redis get error: {e}")
+
+            result = await func(*args, **kwargs)
+            if isinstance(result, BaseModel):
+                body = result.model_dump_json().encode()
+            else:
+                body = orjson.dumps(result, option=ORJSON_OPTIONS)
+
+            if client:
+                try:
+                    await client.setex(cache_key, ttl, body)
+                except Exception as e:
+                    logger.warning(f"Redis set error: {e}")
+
+            return Response(content=body, media_type="application/json")
+
+        return wrapper
+
+    return decorator
+
+
 class CacheService:
     """
     Async Redis cache service with automatic fallback.
@@ -95,7 +149,7 @@ class CacheService:
             try:
                 value = await self.redis.get(key)
                 if value:
-                    return json.loads(value)
+                    return orjson.loads(value)
             except Exception as e:
                 logger.warning(f"Redis get error: {e}")
 
@@ -113,7 +167,7 @@ class CacheService:
 
     async def set(self, key: str, value: Any, ttl: int = 300) -> bool:
         """Set value in cache with TTL (seconds)."""
-        serialized = json.dumps(value)
+        serialized = orjson.dumps(value, option=ORJSON_OPTIONS)
 
         # Try Redis first
         if self.redis:
@@ -137,6 +191,39 @@ class CacheService:
 
         return True
 
+    async def mget(self, keys: list[str]) -> list[Any | None]:
+        """Get several values in one round-trip. Missing keys map to None."""
+        if not keys:
+            return []
+
+        if self.redis:
+            try:
+                values = await self.redis.mget(keys)
+                return [orjson.loads(v) if v else None for v in values]
+            except Exception as e:
+                logger.warning(f"Redis mget error: {e}")
+
+        return [await self.get(key) for key in keys]
+
+    async def mset(self, mapping: dict[str, Any], ttl: int = 300) -> bool:
+        """Set several values with the same TTL in one pipelined round-trip."""
+        if not mapping:
+            return True
+
+        if self.redis:
+            try:
+                pipe = self.redis.pipeline(transaction=False)
+                for key, value in mapping.items():
+                    pipe.setex(key, ttl, orjson.dumps(value, option=ORJSON_OPTIONS))
+                await pipe.execute()
+                return True
+            except Exception as e:
+                logger.warning(f"Redis mset error: {e}")
+
+        for key, value in mapping.items():
+            await self.set(key, value, ttl)
+        return True
+
     async def delete(self, key: str) -> bool:
         """Delete key from cache."""
         if self.redis:
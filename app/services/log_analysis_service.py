@@ -108,5 +108,9 @@ async def main():
 if __name__ == "__main__":
     import asyncio
 
-    # Убедитесь, что у вас есть запущенный event loop
-    asyncio.run(main())
+    try:
+        import uvloop
+    except ImportError:  # uvloop недоступен на Windows
+        asyncio.run(main())
+    else:
+        uvloop.run(main())
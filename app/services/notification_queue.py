@@ -0,0 +1,118 @@
+"""
+Фоновая очередь Telegram-уведомлений.
+
+Анализ не ждет HTTPS-запрос к Telegram на каждое уведомление: сообщения
+складываются в очередь, а фоновая задача раз в FLUSH_INTERVAL секунд (или
+при накоплении FLUSH_BATCH_MAX сообщений) отправляет их одним сообщением.
+"""
+
+import asyncio
+
+from app.services import telegram_service
+from app.utils.logger import logger
+
+QUEUE_MAXSIZE = 1000
+FLUSH_INTERVAL = 3.0  # seconds
+FLUSH_BATCH_MAX = 20
+MESSAGE_SEPARATOR = "\n---\n"
+# Telegram ограничивает сообщение 4096 символами
+TELEGRAM_MAX_CHARS = 4000
+
+# Сигнал фоновой задаче: отправить собранный пакет и завершиться
+_STOP = object()
+
+_queue: asyncio.Queue | None = None
+_flusher_task: asyncio.Task | None = None
+_loop: asyncio.AbstractEventLoop | None = None
+
+
+def start_flusher() -> None:
+    """Запускает фоновую отправку в текущем event loop (повторный вызов ничего не делает)."""
+    global _queue, _flusher_task, _loop
+    loop = asyncio.get_running_loop()
+    if _flusher_task is not None and not _flusher_task.done() and _loop is loop:
+        return
+    _loop = loop
+    old_queue, _queue = _queue, asyncio.Queue(maxsize=QUEUE_MAXSIZE)
+    _flusher_task = asyncio.create_task(_flusher())
+
+    # Неотправленные сообщения прежней очереди переносим в новую
+    moved = 0
+    while old_queue is not None and not old_queue.empty():
+        item = old_queue.get_nowait()
+        if item is not _STOP:
+            _queue.put_nowait(item)
+            moved += 1
+    if moved:
+        logger.info(f"Перенесено {moved} неотправленных уведомлений в новую очередь")
+
+
+async def stop_flusher() -> None:
+    """Останавливает фоновую задачу и отправляет то, что осталось в очереди."""
+    global _flusher_task
+    if _flusher_task is not None and not _flusher_task.done():
+        # Останавливаем кооперативно: пакет, уже взятый из очереди, будет отправлен
+        await _queue.put(_STOP)
+        await _flusher_task
+    _flusher_task = None
+
+    if _queue is not None:
+        pending = []
+        while not _queue.empty():
+            item = _queue.get_nowait()
+            if item is not _STOP:
+                pending.append(item)
+        if pending:
+            await _send_batch(pending)
+
+
+def enqueue_message(text: str) -> None:
+    """Ставит сообщение в очередь на отправку, не дожидаясь Telegram."""
+    start_flusher()
+    try:
+        _queue.put_nowait(text)
+    except asyncio.QueueFull:
+        logger.warning(f"Очередь уведомлений переполнена, сообщение отброшено: {text[:100]}")
+
+
+async def _flusher() -> None:
+    loop = asyncio.get_running_loop()
+    while True:
+        item = await _queue.get()
+        if item is _STOP:
+            return
+        batch = [item]
+        stopping = False
+        deadline = loop.time() + FLUSH_INTERVAL
+        while len(batch) < FLUSH_BATCH_MAX:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                item = await asyncio.wait_for(_queue.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            if item is _STOP:
+                stopping = True
+                break
+            batch.append(item)
+
+        await _send_batch(batch)
+        if stopping:
+            return
+
+
+async def _send_batch(batch: list[str]) -> None:
+    """Склеивает сообщения и отправляет их, не превышая лимит длины Telegram."""
+    chunks = [batch[0]]
+    for text in batch[1:]:
+        if len(chunks[-1]) + len(MESSAGE_SEPARATOR) + len(text) > TELEGRAM_MAX_CHARS:
+            chunks.append(text)
+        else:
+            chunks[-1] += MESSAGE_SEPARATOR + text
+
+    for chunk in chunks:
+        try:
+            await telegram_service.send_message(chunk)
+        except Exception as e:
+            logger.error(f"Ошибка отправки пакета уведомлений: {e}")
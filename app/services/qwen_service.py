@@ -9,6 +9,30 @@ import aiohttp
 from app.utils.logger import logger
 from config.settings import settings
 
+# Одна сессия на процесс: пул соединений и keep-alive переиспользуются между запросами
+_session: aiohttp.ClientSession | None = None
+
+
+async def get_session() -> aiohttp.ClientSession:
+    """Get or create the shared aiohttp session for the LLM endpoint."""
+    global _session
+    if _session is None or _session.closed:
+        _session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                limit=50, limit_per_host=20, ttl_dns_cache=300, keepalive_timeout=60, enable_cleanup_closed=True
+            ),
+            timeout=aiohttp.ClientTimeout(total=60),
+        )
+    return _session
+
+
+async def close_session() -> None:
+    """Close the shared session (call on application shutdown)."""
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
+
 
 async def interpret_command(query: str) -> dict:
     """
@@ -43,28 +67,28 @@ async def interpret_command(query: str) -> dict:
 
     # Используем тот же эндпоинт, что и для других LLM, предполагая, что там развернута нужная модель
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.post(settings.llm_endpoint, json=payload) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    json_response_str = data[0]["generated_text"][len(prompt) :].strip()
-                    try:
-                        # Очистка от возможных артефактов
-                        if json_response_str.startswith("```json"):
-                            json_response_str = json_response_str[7:]
-                        if json_response_str.endswith("```"):
-                            json_response_str = json_response_str[:-3]
-
-                        result_json = json.loads(json_response_str.strip())
-                        logger.info(f"Qwen успешно интерпретировал команду: {result_json}")
-                        return result_json
-                    except json.JSONDecodeError as e:
-                        logger.error(f"Ошибка декодирования JSON от Qwen: {e}")
-                        logger.error(f"Полученная строка: {json_response_str}")
-                        raise ValueError("Qwen вернул некорректный JSON.")
-                else:
-                    logger.error(f"Ошибка при обращении к Qwen: {response.status} {await response.text()}")
-                    raise ConnectionError(f"Ошибка API модели Qwen: {response.status}")
+        session = await get_session()
+        async with session.post(settings.llm_endpoint, json=payload) as response:
+            if response.status == 200:
+                data = await response.json()
+                json_response_str = data[0]["generated_text"][len(prompt) :].strip()
+                try:
+                    # Очистка от возможных артефактов
+                    if json_response_str.startswith("```json"):
+                        json_response_str = json_response_str[7:]
+                    if json_response_str.endswith("```"):
+                        json_response_str = json_response_str[:-3]
+
+                    result_json = json.loads(json_response_str.strip())
+                    logger.info(f"Qwen успешно интерпретировал команду: {result_json}")
+                    return result_json
+                except json.JSONDecodeError as e:
+                    logger.error(f"Ошибка декодирования JSON от Qwen: {e}")
+                    logger.error(f"Полученная строка: {json_response_str}")
+                    raise ValueError("Qwen вернул некорректный JSON.")
+            else:
+                logger.error(f"Ошибка при обращении к Qwen: {response.status} {await response.text()}")
+                raise ConnectionError(f"Ошибка API модели Qwen: {response.status}")
     except Exception as e:
         logger.error(f"Исключение при вызове Qwen: {e}")
         raise
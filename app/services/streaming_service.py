@@ -17,6 +17,8 @@ from collections.abc import Callable
 from dataclasses import dataclass, field
 from typing import Any
 
+import msgspec
+
 from app.utils.logger import logger
 from config.settings import settings
 
@@ -61,6 +63,8 @@ class LogEntry:
     message: str
     source: str = ""
     metadata: dict[str, Any] = field(default_factory=dict)
+    # Исходный JSON документа; если задан, используется вместо metadata без повторной сериализации
+    raw_metadata: bytes | None = None
 
     def to_dict(self) -> dict[str, str]:
         """Convert to dict for Redis Stream."""
@@ -70,7 +74,7 @@ class LogEntry:
             "level": self.level,
             "message": self.message,
             "source": self.source,
-            "metadata": json.dumps(self.metadata),
+            "metadata": self.raw_metadata.decode() if self.raw_metadata is not None else json.dumps(self.metadata),
         }
 
     @classmethod
@@ -91,6 +95,61 @@ class LogEntry:
         )
 
 
+class RawLog(msgspec.Struct):
+    """
+    Поля входящего лога (Filebeat, Fluentd и т.д.), нужные для LogEntry.
+
+    Остальные поля документа не декодируются.
+    """
+
+    at_timestamp: Any = msgspec.field(default=None, name="@timestamp")
+    timestamp: Any = None
+    service: Any = None
+    log: Any = None
+    level: Any = None
+    message: Any = None
+    source: Any = None
+
+    def to_log_entry(self, raw: bytes) -> LogEntry:
+        service = self.service.get("name", "unknown") if isinstance(self.service, dict) else self.service
+        level = self.log.get("level") if isinstance(self.log, dict) else None
+        return LogEntry(
+            timestamp=_as_str(self.at_timestamp or self.timestamp),
+            service=service or "unknown",
+            level=level or self.level or "info",
+            message=_as_str(self.message),
+            source=_as_str(self.source),
+            raw_metadata=raw,
+        )
+
+
+def _as_str(value: Any) -> str:
+    """Приводит значение поля к строке: null -> "", объекты ECS (например source) -> JSON."""
+    if value is None:
+        return ""
+    if isinstance(value, str):
+        return value
+    return json.dumps(value)
+
+
+_raw_batch_decoder = msgspec.json.Decoder(list[msgspec.Raw])
+_raw_log_decoder = msgspec.json.Decoder(RawLog)
+
+
+def decode_log_batch(body: bytes) -> list[LogEntry]:
+    """
+    Декодирует один лог или массив логов из тела запроса.
+
+    Из каждого документа извлекаются только поля RawLog, исходные байты
+    документа сохраняются как metadata.
+    """
+    if body.lstrip()[:1] == b"[":
+        documents = [bytes(raw) for raw in _raw_batch_decoder.decode(body)]
+    else:
+        documents = [body]
+    return [_raw_log_decoder.decode(doc).to_log_entry(doc) for doc in documents]
+
+
 class StreamingService:
     """
     Service for processing logs via Redis Streams.
@@ -175,7 +234,8 @@ class StreamingService:
             return 0
 
         published = 0
-        pipeline = self.redis.pipeline()
+        # Independent XADDs need no MULTI/EXEC, only a single round-trip
+        pipeline = self.redis.pipeline(transaction=False)
 
         for log in logs:
             pipeline.xadd(self.STREAM_KEY, log.to_dict(), maxlen=self.MAX_STREAM_LENGTH, approximate=True)
@@ -200,6 +260,17 @@ class StreamingService:
             if len(self._buffer) >= self.BATCH_SIZE or (time.time() - self._last_flush) > self._flush_interval:
                 await self._flush_buffer()
 
+    async def buffer_logs(self, logs: list[LogEntry]):
+        """
+        Buffer a batch of log entries under a single lock acquisition.
+        A batch that fills the buffer is published in one pipeline.
+        """
+        async with self._buffer_lock:
+            self._buffer.extend(logs)
+
+            if len(self._buffer) >= self.BATCH_SIZE or (time.time() - self._last_flush) > self._flush_interval:
+                await self._flush_buffer()
+
     async def _flush_buffer(self):
         """Flush buffered logs to stream."""
         if not self._buffer:
@@ -1,6 +1,6 @@
+import asyncio
 import datetime
 
-import aiohttp
 import redis.asyncio as redis
 from elasticsearch import AsyncElasticsearch
 
@@ -26,12 +26,16 @@ async def get_elasticsearch_status() -> str:
 
 async def get_prometheus_status() -> str:
     """Проверка статуса Prometheus."""
+    # Общая сессия коллектора метрик: без нового TCP-соединения на каждую проверку
+    # (импорт внутри функции, т.к. analysis_service импортирует этот модуль)
+    from app.services.analysis_service import get_shared_http_session
+
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(f"{settings.prometheus_url}/-/healthy") as response:
-                if response.status == 200:
-                    return "ok"
-                return f"unavailable (status: {response.status})"
+        session = get_shared_http_session()
+        async with session.get(f"{settings.prometheus_url}/-/healthy") as response:
+            if response.status == 200:
+                return "ok"
+            return f"unavailable (status: {response.status})"
     except Exception as e:
         logger.error(f"Ошибка подключения к Prometheus: {e}")
         return "error"
@@ -82,6 +86,11 @@ async def get_plan_from_db(plan_id: str) -> RemediationPlan:
 
 async def save_plan_to_db(plan: RemediationPlan):
     """Сохранение плана в Redis."""
-    await redis_client.hset(f"plan:{plan.plan_id}", mapping=plan.dict())
-    if plan.status == ActionStatus.PENDING:
-        await redis_client.sadd("pending_plans", plan.plan_id)
+    # Запись плана и обновление множества ожидающих планов одним round-trip
+    async with redis_client.pipeline(transaction=False) as pipe:
+        pipe.hset(f"plan:{plan.plan_id}", mapping=plan.dict())
+        if plan.status == ActionStatus.PENDING:
+            pipe.sadd("pending_plans", plan.plan_id)
+        else:
+            pipe.srem("pending_plans", plan.plan_id)
+        await pipe.execute()
@@ -0,0 +1,62 @@
+"""
+TTL memoization for async functions.
+
+Concurrent calls with the same arguments are coalesced: the first caller
+runs the function while the rest wait on a per-key lock and then read the
+cached result. Exceptions are not cached.
+"""
+
+import asyncio
+from collections.abc import Callable, Hashable
+from functools import wraps
+from typing import Any
+
+from cachetools import TTLCache
+
+
+def async_ttl_cache(ttl: float = 30, maxsize: int = 256, key_extra: Callable[[], Hashable] | None = None):
+    """
+    Cache results of an async function for ttl seconds.
+
+    Args:
+        ttl: Time-to-live of a cached result in seconds
+        maxsize: Maximum number of cached results
+        key_extra: Optional callable whose value is added to every key, so a
+            change in it (e.g. circuit breaker state) invalidates old entries
+
+    Usage:
+        @async_ttl_cache(ttl=30, key_extra=lambda: prometheus_breaker.state)
+        async def fetch_metrics(service_name: str, time_window: str) -> dict: ...
+    """
+
+    def decorator(func: Callable) -> Callable:
+        cache: TTLCache = TTLCache(maxsize=maxsize, ttl=ttl)
+        locks: dict[Hashable, asyncio.Lock] = {}
+        missing = object()
+
+        @wraps(func)
+        async def wrapper(*args, **kwargs) -> Any:
+            key = (args, tuple(sorted(kwargs.items())))
+            if key_extra is not None:
+                key += (key_extra(),)
+
+            result = cache.get(key, missing)
+            if result is not missing:
+                return result
+
+            lock = locks.setdefault(key, asyncio.Lock())
+            try:
+                async with lock:
+                    result = cache.get(key, missing)
+                    if result is missing:
+                        result = await func(*args, **kwargs)
+                        cache[key] = result
+                    return result
+            finally:
+                if not lock.locked():
+                    locks.pop(key, None)
+
+        wrapper.cache_clear = cache.clear
+        return wrapper
+
+    return decorator
@@ -5,11 +5,15 @@ States:
 - CLOSED: Normal operation, requests pass through
 - OPEN: Failures exceeded threshold, requests fail fast
 - HALF_OPEN: Testing if service recovered
+
+In HALF_OPEN only one trial request is let through at a time. If a probe is
+configured, it runs first and a successful probe closes the circuit. Every
+failed recovery attempt doubles the open timeout, up to max_timeout.
 """
 
 import asyncio
 import time
-from collections.abc import Callable
+from collections.abc import Awaitable, Callable
 from dataclasses import dataclass, field
 from enum import Enum
 from functools import wraps
@@ -32,6 +36,9 @@ class CircuitBreakerConfig:
     success_threshold: int = 2  # Successes needed to close from half-open
     timeout: float = 30.0  # Seconds before trying half-open
     excluded_exceptions: tuple = ()  # Exceptions that don't count as failures
+    max_timeout: float = 300.0  # Upper bound for the backed-off open timeout
+    probe: Callable[[], Awaitable[Any]] | None = None  # Cheap health check run before the half-open trial
+    probe_timeout: float = 2.0  # Seconds before a probe counts as failed
 
 
 @dataclass
@@ -43,6 +50,8 @@ class CircuitBreakerState:
     success_count: int = 0
     last_failure_time: float = 0
     last_state_change: float = field(default_factory=time.time)
+    open_count: int = 0  # Consecutive openings without recovery
+    trial_in_flight: bool = False
 
 
 class CircuitBreaker:
@@ -91,6 +100,16 @@ class CircuitBreaker:
     def is_open(self) -> bool:
         return self._state.state == CircuitState.OPEN
 
+    @property
+    def open_timeout(self) -> float:
+        """Current open timeout, doubled for every failed recovery attempt."""
+        backoff = 2 ** max(self._state.open_count - 1, 0)
+        return min(self.config.timeout * backoff, max(self.config.max_timeout, self.config.timeout))
+
+    def set_probe(self, probe: Callable[[], Awaitable[Any]] | None) -> None:
+        """Set the health check used to leave the OPEN state."""
+        self.config.probe = probe
+
     async def _check_state(self) -> bool:
         """Check if request should be allowed. Returns True if allowed."""
         async with self._lock:
@@ -99,24 +118,59 @@ class CircuitBreaker:
 
             if self._state.state == CircuitState.OPEN:
                 # Check if timeout has passed
-                if time.time() - self._state.last_failure_time >= self.config.timeout:
-                    self._state.state = CircuitState.HALF_OPEN
-                    self._state.success_count = 0
-                    logger.info(f"Circuit breaker '{self.name}' transitioning to HALF_OPEN")
-                    return True
+                if time.time() - self._state.last_failure_time < self.open_timeout:
+                    return False
+                self._state.state = CircuitState.HALF_OPEN
+                self._state.success_count = 0
+                self._state.trial_in_flight = True
+                logger.info(f"Circuit breaker '{self.name}' transitioning to HALF_OPEN")
+                probe = self.config.probe
+            elif self._state.trial_in_flight:
+                # HALF_OPEN - only one trial request at a time
                 return False
+            else:
+                self._state.trial_in_flight = True
+                return True
 
-            # HALF_OPEN - allow limited requests
+        if probe is None:
             return True
 
+        # Probe runs outside the lock; concurrent callers are rejected meanwhile
+        try:
+            await asyncio.wait_for(probe(), timeout=self.config.probe_timeout)
+        except Exception as e:
+            logger.warning(f"Circuit breaker '{self.name}' probe failed: {e}")
+            await self._record_failure(e)
+            return False
+        except BaseException:
+            await self._release_trial()
+            raise
+
+        async with self._lock:
+            if self._state.state == CircuitState.HALF_OPEN:
+                self._close()
+                logger.info(f"Circuit breaker '{self.name}' CLOSED after successful probe")
+        return True
+
+    def _close(self) -> None:
+        self._state.state = CircuitState.CLOSED
+        self._state.failure_count = 0
+        self._state.open_count = 0
+        self._state.trial_in_flight = False
+
+    async def _release_trial(self) -> None:
+        """Free the half-open trial slot when a call ends without an outcome."""
+        async with self._lock:
+            self._state.trial_in_flight = False
+
     async def _record_success(self):
         """Record a successful call."""
         async with self._lock:
             if self._state.state == CircuitState.HALF_OPEN:
+                self._state.trial_in_flight = False
                 self._state.success_count += 1
                 if self._state.success_count >= self.config.success_threshold:
-                    self._state.state = CircuitState.CLOSED
-                    self._state.failure_count = 0
+                    self._close()
                     logger.info(f"Circuit breaker '{self.name}' CLOSED after recovery")
             elif self._state.state == CircuitState.CLOSED:
                 # Reset failure count on success
@@ -126,20 +180,27 @@ class CircuitBreaker:
         """Record a failed call."""
         # Check if exception should be excluded
         if isinstance(exception, self.config.excluded_exceptions):
+            await self._release_trial()
             return
 
         async with self._lock:
             self._state.failure_count += 1
             self._state.last_failure_time = time.time()
+            self._state.trial_in_flight = False
 
             if self._state.state == CircuitState.HALF_OPEN:
-                # Any failure in half-open goes back to open
+                # Any failure in half-open goes back to open, with a longer timeout
                 self._state.state = CircuitState.OPEN
-                logger.warning(f"Circuit breaker '{self.name}' OPEN again after failure in half-open")
+                self._state.open_count += 1
+                logger.warning(
+                    f"Circuit breaker '{self.name}' OPEN again after failure in half-open, "
+                    f"retry in {self.open_timeout:.0f}s"
+                )
 
             elif self._state.state == CircuitState.CLOSED:
                 if self._state.failure_count >= self.config.failure_threshold:
                     self._state.state = CircuitState.OPEN
+                    self._state.open_count = 1
                     logger.warning(f"Circuit breaker '{self.name}' OPEN after {self._state.failure_count} failures")
 
     def __call__(self, func: Callable) -> Callable:
@@ -157,6 +218,9 @@ class CircuitBreaker:
             except Exception as e:
                 await self._record_failure(e)
                 raise
+            except BaseException:
+                await self._release_trial()
+                raise
 
         return wrapper
 
@@ -175,6 +239,9 @@ class CircuitBreaker:
         except Exception as e:
             await self._record_failure(e)
             raise
+        except BaseException:
+            await self._release_trial()
+            raise
 
     def reset(self):
         """Manually reset the circuit breaker."""
@@ -189,6 +256,7 @@ class CircuitBreaker:
             "failure_count": self._state.failure_count,
             "success_count": self._state.success_count,
             "last_failure": self._state.last_failure_time,
+            "open_timeout": self.open_timeout,
         }
 
 
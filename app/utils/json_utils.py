@@ -0,0 +1,16 @@
+"""
+JSON helpers for request handling.
+
+Request bodies are parsed with orjson instead of the stdlib json module
+that Starlette uses in ``Request.json()``.
+"""
+
+from typing import Any
+
+import orjson
+from fastapi import Request
+
+
+async def parse_json(request: Request) -> Any:
+    """Read the request body and decode it with orjson."""
+    return orjson.loads(await request.body())
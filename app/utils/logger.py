@@ -44,3 +44,8 @@ def setup_logger(name: str) -> logging.Logger:
 
 
 logger = setup_logger("aiops")
+
+
+def get_logger(name: str) -> logging.Logger:
+    """Логгер модуля: дочерний к "aiops", пишет в его handlers"""
+    return logger.getChild(name)
@@ -6,6 +6,9 @@ import os
 from pydantic_settings import BaseSettings
 from typing import Optional
 
+# Публично известный секрет по умолчанию: с ним команды от n8n не принимаются
+DEFAULT_N8N_WEBHOOK_SECRET = "aiops-webhook-secret"
+
 
 class Settings(BaseSettings):
     """Основные настройки приложения"""
@@ -26,9 +29,22 @@ class Settings(BaseSettings):
         "ELASTICSEARCH_URL", 
         f"http://{os.getenv('ELASTICSEARCH_HOST', 'localhost')}:{os.getenv('ELASTICSEARCH_PORT', '9200')}"
     )
+    # Сколько секунд переиспользовать результаты поиска логов для одного сервиса и окна
+    elasticsearch_cache_ttl: int = int(os.getenv("ELASTICSEARCH_CACHE_TTL", "30"))
+    # Максимум одновременных запросов к Elasticsearch из сервиса анализа
+    elasticsearch_max_inflight: int = int(os.getenv("ELASTICSEARCH_MAX_INFLIGHT", "16"))
+    # Размер пула соединений к каждому узлу ES (по умолчанию в клиенте всего 10)
+    elasticsearch_pool_size: int = int(os.getenv("ELASTICSEARCH_POOL_SIZE", "64"))
     
     # ==================== Prometheus ====================
     prometheus_url: str = os.getenv("PROMETHEUS_URL", "http://localhost:9090")
+    # Сколько секунд переиспользовать результаты запросов метрик для одного сервиса и окна
+    prometheus_cache_ttl: int = int(os.getenv("PROMETHEUS_CACHE_TTL", "30"))
+    # Максимум одновременных запросов к Prometheus из сервиса анализа
+    prometheus_max_inflight: int = int(os.getenv("PROMETHEUS_MAX_INFLIGHT", "16"))
+    # Пул соединений aiohttp к Prometheus
+    prometheus_pool_limit: int = int(os.getenv("PROMETHEUS_POOL_LIMIT", "64"))
+    prometheus_pool_limit_per_host: int = int(os.getenv("PROMETHEUS_POOL_LIMIT_PER_HOST", "32"))
     
     # ==================== Redis ====================
     redis_host: str = os.getenv("REDIS_HOST", "localhost")
@@ -131,8 +147,10 @@ class Settings(BaseSettings):
     # ==================== n8n Integration ====================
     n8n_url: str = os.getenv("N8N_URL", "http://localhost:5678")
     n8n_api_key: str = os.getenv("N8N_API_KEY", "")
-    n8n_webhook_secret: str = os.getenv("N8N_WEBHOOK_SECRET", "aiops-webhook-secret")
+    n8n_webhook_secret: str = os.getenv("N8N_WEBHOOK_SECRET", DEFAULT_N8N_WEBHOOK_SECRET)
     n8n_enabled: bool = os.getenv("N8N_ENABLED", "true").lower() == "true"
+    # Отключать проверку подписи команд от n8n можно только явно (N8N_REQUIRE_SIGNATURE=false)
+    n8n_require_signature: bool = os.getenv("N8N_REQUIRE_SIGNATURE", "true").lower() == "true"
     
     # ==================== Streaming ====================
     streaming_enabled: bool = os.getenv("STREAMING_ENABLED", "true").lower() == "true"
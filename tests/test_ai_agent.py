@@ -17,6 +17,7 @@ from app.services.ai_agent_service import (
     AIAgentService,
     Intent,
     ParsedIntent,
+    _extract_json_object,
     get_ai_agent
 )
 
@@ -274,6 +275,65 @@ class TestAIAgentServiceAsync:
         result = await agent.parse_message("помощь", context=context)
         
         assert result.intent == Intent.HELP
+    
+    @pytest.mark.asyncio
+    async def test_parse_message_uses_l1_cache(self, agent):
+        """Повторное сообщение берется из локального кэша без обращения к Redis."""
+        agent._parse_with_llm = AsyncMock(return_value=ParsedIntent(
+            intent=Intent.CREATE_BACKUP,
+            confidence=0.9,
+            original_message="сделай бэкап"
+        ))
+        
+        await agent.parse_message("сделай бэкап")
+        result = await agent.parse_message("Сделай бэкап")
+        
+        assert result.intent == Intent.CREATE_BACKUP
+        assert result.original_message == "Сделай бэкап"
+        agent._parse_with_llm.assert_awaited_once()
+        agent.cache_service.get.assert_awaited_once()
+    
+    @pytest.mark.asyncio
+    async def test_parse_batch(self, agent):
+        """Проверяет пакетный парсинг: один MGET, LLM один раз на уникальное сообщение."""
+        agent.cache_service.mget = AsyncMock(return_value=[None])
+        agent.cache_service.mset = AsyncMock()
+        agent._parse_with_llm = AsyncMock(return_value=ParsedIntent(
+            intent=Intent.CREATE_BACKUP,
+            confidence=0.9,
+            original_message="сделай бэкап"
+        ))
+        
+        results = await agent.parse_batch(["помощь", "", "сделай бэкап", "Сделай бэкап "])
+        
+        assert [r.intent for r in results] == [
+            Intent.HELP, Intent.UNKNOWN, Intent.CREATE_BACKUP, Intent.CREATE_BACKUP
+        ]
+        assert results[3].original_message == "Сделай бэкап"
+        agent.cache_service.mget.assert_awaited_once()
+        agent._parse_with_llm.assert_awaited_once()
+        agent.cache_service.mset.assert_awaited_once()
+
+
+class TestExtractJsonObject:
+    """Тесты для извлечения JSON из ответа LLM."""
+    
+    def test_extract_json_with_surrounding_text(self):
+        """Проверяет, что текст до и после объекта отбрасывается."""
+        text = 'Вот ответ: {"intent": "help", "parameters": {"a": 1}} Надеюсь, помог {:)}'
+        
+        assert _extract_json_object(text) == '{"intent": "help", "parameters": {"a": 1}}'
+    
+    def test_extract_json_ignores_braces_in_strings(self):
+        """Проверяет, что скобки внутри строк не влияют на баланс."""
+        text = '{"suggested_response": "скобка } и \\" кавычка", "confidence": 0.9}'
+        
+        assert _extract_json_object(text) == text
+    
+    def test_extract_json_no_object(self):
+        """Проверяет ответ без JSON или с незакрытым объектом."""
+        assert _extract_json_object("просто текст") is None
+        assert _extract_json_object('{"intent": "help"') is None
 
 
 class TestGetAIAgent:
@@ -0,0 +1,360 @@
+"""
+Unit tests for AI Service helpers and analysis batching.
+"""
+
+import asyncio
+import json
+import os
+import sys
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+
+from app.services import ai_service
+from app.services.ai_service import AnalysisBatcher, _dedupe_logs, _match_local_command, _normalize_for_key
+
+
+def _analysis(summary: str) -> dict:
+    return {"summary": summary, "root_cause": "cause", "severity": "High", "relevant_logs": []}
+
+
+class TestDedupeLogs:
+    """Tests for _dedupe_logs."""
+
+    @pytest.mark.unit
+    def test_collapses_lines_differing_only_by_timestamp(self):
+        """Consecutive lines that differ only by timestamps should collapse into one."""
+        logs = "2024-01-01T00:00:01Z health ok\n2024-01-01T00:00:02.5Z health ok\nERROR boom"
+
+        assert _dedupe_logs(logs) == "(x2) 2024-01-01T00:00:01Z health ok\nERROR boom"
+
+    @pytest.mark.unit
+    def test_non_consecutive_duplicates_kept(self):
+        """Only consecutive runs are collapsed, so ordering is preserved."""
+        assert _dedupe_logs("a\nb\na") == "a\nb\na"
+
+
+class TestNormalizeForKey:
+    """Tests for cache key normalization."""
+
+    @pytest.mark.unit
+    def test_ignores_timestamps_pids_and_whitespace(self):
+        """Inputs differing only in volatile tokens should normalize identically."""
+        first = "2024-01-01T10:00:00Z  Worker[123456]   Failed to connect\n"
+        second = "2024-01-02T11:30:15.250Z Worker[654321] failed to connect"
+
+        assert _normalize_for_key(first) == _normalize_for_key(second)
+
+    @pytest.mark.unit
+    def test_keeps_short_numbers(self):
+        """Short numbers such as status codes should still distinguish inputs."""
+        assert _normalize_for_key("HTTP 500") != _normalize_for_key("HTTP 502")
+
+
+class TestMatchLocalCommand:
+    """Tests for the local command matcher used before the LLM."""
+
+    @pytest.mark.unit
+    @pytest.mark.parametrize(
+        ("query", "expected"),
+        [
+            ("список vm", {"action": "list_vms", "target": None, "parameters": {}}),
+            ("статус системы", {"action": "get_status", "target": "system", "parameters": {}}),
+            ("Статус nginx", {"action": "get_status", "target": "nginx", "parameters": {}}),
+            ("перезапусти nginx", {"action": "restart_service", "target": "nginx", "parameters": {}}),
+            ("Останови ВМ 205", {"action": "vm_action", "target": "205", "parameters": {"action": "stop"}}),
+            (
+                "проанализируй сервис payment-gateway",
+                {"action": "analyze_service", "target": "payment-gateway", "parameters": {}},
+            ),
+        ],
+    )
+    def test_unambiguous_commands_matched(self, query, expected):
+        """Short commands with a clear action should be resolved locally."""
+        assert _match_local_command(query) == expected
+
+    @pytest.mark.unit
+    @pytest.mark.parametrize(
+        "query",
+        [
+            "перезапусти nginx если он упал",
+            "покажи логи nginx за час",
+            "перезапусти сервис",
+            "что с сервером?",
+            "analyze logs",
+            "проанализируй логи",
+            "перезапусти его",
+            "restart all",
+            "статус проекта",
+        ],
+    )
+    def test_ambiguous_commands_left_to_llm(self, query):
+        """Commands with extra qualifiers or no concrete target should go to the LLM."""
+        assert _match_local_command(query) is None
+
+
+class TestSystemPromptBudget:
+    """System prompts are sent with every call, so guard their size."""
+
+    @pytest.fixture(scope="class")
+    def encoding(self):
+        tiktoken = pytest.importorskip("tiktoken")
+        try:
+            return tiktoken.get_encoding("o200k_base")
+        except Exception as e:
+            pytest.skip(f"o200k_base encoding unavailable: {e}")
+
+    @pytest.mark.unit
+    @pytest.mark.parametrize(
+        ("prompt_name", "max_tokens"), [("_SYS_ANALYSIS", 220), ("_SYS_PLAYBOOK", 170), ("_SYS_NL", 260)]
+    )
+    def test_system_prompt_within_budget(self, encoding, prompt_name, max_tokens):
+        """Each system prompt should stay within its token budget."""
+        assert len(encoding.encode(getattr(ai_service, prompt_name))) <= max_tokens
+
+
+class TestAnalysisBatcher:
+    """Tests for AnalysisBatcher."""
+
+    @pytest.mark.asyncio
+    async def test_concurrent_requests_share_one_call(self):
+        """Requests arriving within the wait window should be sent as one LLM call."""
+        reply = json.dumps({"results": [_analysis("first"), _analysis("second")]})
+        llm = AsyncMock(return_value=reply)
+        batcher = AnalysisBatcher(max_batch=8, max_wait_ms=20)
+
+        with patch.object(ai_service, "_call_llm_with_fallback", llm):
+            results = await asyncio.gather(batcher.submit("logs 1"), batcher.submit("logs 2"))
+        await batcher.stop()
+
+        assert [r["summary"] for r in results] == ["first", "second"]
+        assert llm.await_count == 1
+        user_message = llm.await_args.kwargs["messages"][1]["content"]
+        assert "[BLOCK 1]\nlogs 1" in user_message
+        assert "[BLOCK 2]\nlogs 2" in user_message
+
+    @pytest.mark.asyncio
+    async def test_mismatched_batch_reply_falls_back_to_single_calls(self):
+        """An unusable batch reply should be retried block by block."""
+        llm = AsyncMock(
+            side_effect=[json.dumps([_analysis("only one")]), json.dumps(_analysis("a")), json.dumps(_analysis("b"))]
+        )
+        batcher = AnalysisBatcher(max_batch=8, max_wait_ms=20)
+
+        with patch.object(ai_service, "_call_llm_with_fallback", llm):
+            results = await asyncio.gather(batcher.submit("logs 1"), batcher.submit("logs 2"))
+        await batcher.stop()
+
+        assert sorted(r["summary"] for r in results) == ["a", "b"]
+        assert llm.await_count == 3
+
+    @pytest.mark.asyncio
+    async def test_single_request_uses_plain_prompt(self):
+        """A lone request should not be wrapped in the batch format."""
+        llm = AsyncMock(return_value=json.dumps(_analysis("solo")))
+        batcher = AnalysisBatcher(max_batch=8, max_wait_ms=1)
+
+        with patch.object(ai_service, "_call_llm_with_fallback", llm):
+            result = await batcher.submit("logs")
+        await batcher.stop()
+
+        assert result["summary"] == "solo"
+        assert "[BLOCK" not in llm.await_args.kwargs["messages"][1]["content"]
+        assert llm.await_args.kwargs["response_format"]["json_schema"]["name"] == "log_analysis"
+
+    @pytest.mark.asyncio
+    async def test_llm_error_propagates_to_callers(self):
+        """Provider failures should surface as exceptions on every waiting caller."""
+        llm = AsyncMock(side_effect=RuntimeError("All LLM providers unavailable"))
+        batcher = AnalysisBatcher(max_batch=8, max_wait_ms=20)
+
+        with patch.object(ai_service, "_call_llm_with_fallback", llm):
+            results = await asyncio.gather(batcher.submit("a"), batcher.submit("b"), return_exceptions=True)
+        await batcher.stop()
+
+        assert all(isinstance(r, RuntimeError) for r in results)
+
+    @pytest.mark.asyncio
+    async def test_stop_cancels_waiting_callers(self):
+        """Callers of a batch still collecting or being processed should not hang after stop()."""
+
+        async def stalled(**kwargs):
+            await asyncio.sleep(5)
+
+        batcher = AnalysisBatcher(max_batch=8, max_wait_ms=20)
+
+        with patch.object(ai_service, "_call_llm_with_fallback", stalled):
+            in_flight = asyncio.ensure_future(batcher.submit("a"))
+            await asyncio.sleep(0.05)
+            collecting = asyncio.ensure_future(batcher.submit("b"))
+            await asyncio.sleep(0)
+            await batcher.stop()
+            results = await asyncio.wait_for(asyncio.gather(in_flight, collecting, return_exceptions=True), 1)
+
+        assert all(isinstance(r, asyncio.CancelledError) for r in results)
+
+
+class TestModelCascade:
+    """Tests for routing between CHEAP_MODEL and DEFAULT_MODEL."""
+
+    @pytest.fixture
+    def no_cache(self):
+        ai_service._l1_cache.clear()
+        with patch.object(ai_service, "cache") as cache:
+            cache.get = AsyncMock(return_value=None)
+            cache.set = AsyncMock()
+            yield cache
+
+    @pytest.mark.asyncio
+    async def test_interpret_escalates_unknown_action(self, no_cache):
+        """An unrecognized command from the cheap model should be retried with the default model."""
+        llm = AsyncMock(
+            side_effect=[
+                json.dumps({"action": "unknown", "target": None, "parameters": {}}),
+                json.dumps({"action": "list_vms", "target": None, "parameters": {}}),
+            ]
+        )
+
+        with patch.object(ai_service, "_call_llm_with_fallback", llm):
+            result = await ai_service.interpret_natural_language("что там с виртуалками")
+
+        assert result["action"] == "list_vms"
+        assert [c.kwargs["model"] for c in llm.await_args_list] == [ai_service.CHEAP_MODEL, ai_service.DEFAULT_MODEL]
+
+    @pytest.mark.asyncio
+    async def test_trivial_logs_use_cheap_model(self, no_cache):
+        """Small INFO-only logs should be analyzed by the cheap model only."""
+        llm = AsyncMock(return_value=json.dumps({**_analysis("routine"), "severity": "Low"}))
+
+        with patch.object(ai_service, "_call_llm_with_fallback", llm):
+            result = await ai_service.analyze_logs_with_llm("INFO request served in 12ms")
+        await ai_service._cheap_analysis_batcher.stop()
+
+        assert result.summary == "routine"
+        assert [c.kwargs["model"] for c in llm.await_args_list] == [ai_service.CHEAP_MODEL]
+
+    @pytest.mark.asyncio
+    async def test_repeat_query_served_from_l1(self, no_cache):
+        """A repeated command should be answered from the in-process cache without Redis or the LLM."""
+        llm = AsyncMock(return_value=json.dumps({"action": "get_logs", "target": "nginx", "parameters": {}}))
+
+        with patch.object(ai_service, "_call_llm_with_fallback", llm):
+            first = await ai_service.interpret_natural_language("логи nginx за последний час")
+            second = await ai_service.interpret_natural_language("логи nginx за последний час")
+
+        assert first == second
+        assert llm.await_count == 1
+        assert no_cache.get.await_count == 1
+
+    @pytest.mark.asyncio
+    async def test_l1_hit_returns_a_copy(self, no_cache):
+        """Mutating a cached result must not change what later callers get from L1."""
+        llm = AsyncMock(return_value=json.dumps({"action": "get_logs", "target": "nginx", "parameters": {}}))
+
+        with patch.object(ai_service, "_call_llm_with_fallback", llm):
+            first = await ai_service.interpret_natural_language("логи nginx за сутки")
+            first["parameters"]["since"] = "1d"
+            second = await ai_service.interpret_natural_language("логи nginx за сутки")
+
+        assert second["parameters"] == {}
+
+
+class TestHedgedCalls:
+    """Tests for racing OpenAI against Ollama."""
+
+    @pytest.mark.asyncio
+    async def test_slow_primary_loses_to_hedge(self):
+        """When OpenAI stalls past the hedge delay, the Ollama answer should win."""
+        cancelled = asyncio.Event()
+
+        async def slow_openai(*args, **kwargs):
+            try:
+                await asyncio.sleep(5)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+            return "openai"
+
+        async def fast_ollama(*args, **kwargs):
+            return "ollama"
+
+        with (
+            patch.object(ai_service, "HEDGE_DELAY_MS", 10),
+            patch.object(ai_service, "_call_openai", slow_openai),
+            patch.object(ai_service, "_call_ollama", fast_ollama),
+        ):
+            result = await ai_service._call_hedged(object(), "model", None, messages=[])
+            await asyncio.wait_for(cancelled.wait(), timeout=1)
+
+        assert result == "ollama"
+
+    @pytest.mark.asyncio
+    async def test_fast_primary_skips_hedge(self):
+        """An OpenAI reply within the hedge delay should not start Ollama."""
+        ollama = AsyncMock(return_value="ollama")
+
+        with (
+            patch.object(ai_service, "HEDGE_DELAY_MS", 200),
+            patch.object(ai_service, "_call_openai", AsyncMock(return_value="openai")),
+            patch.object(ai_service, "_call_ollama", ollama),
+        ):
+            result = await ai_service._call_hedged(object(), "model", None, messages=[])
+
+        assert result == "openai"
+        ollama.assert_not_awaited()
+
+    @pytest.mark.asyncio
+    async def test_cancelled_openai_call_not_recorded(self):
+        """Latency of an OpenAI request cancelled mid-flight should not skew the p95 estimate."""
+
+        async def stalled(*args, **kwargs):
+            await asyncio.sleep(5)
+
+        ai_service._openai_latencies.clear()
+        with patch.object(ai_service.openai_breaker, "call", stalled):
+            task = asyncio.create_task(ai_service._call_openai("model", None, messages=[]))
+            await asyncio.sleep(0.01)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+
+        assert len(ai_service._openai_latencies) == 0
+
+    @pytest.mark.asyncio
+    async def test_breaker_rejection_not_recorded(self):
+        """A call rejected by the open breaker never reached OpenAI, so it adds no latency sample."""
+        ai_service._openai_latencies.clear()
+        rejected = AsyncMock(side_effect=ai_service.CircuitBreakerOpenError("open"))
+
+        with patch.object(ai_service.openai_breaker, "call", rejected):
+            with pytest.raises(ai_service.CircuitBreakerOpenError):
+                await ai_service._call_openai("model", None, messages=[])
+
+        assert len(ai_service._openai_latencies) == 0
+
+    @pytest.mark.asyncio
+    async def test_half_open_trial_not_cancelled(self):
+        """A losing OpenAI request made while HALF_OPEN should finish in the background, not be cancelled."""
+        finished = asyncio.Event()
+
+        async def slow_openai(*args, **kwargs):
+            await asyncio.sleep(0.05)
+            finished.set()
+            return "openai"
+
+        async def fast_ollama(*args, **kwargs):
+            return "ollama"
+
+        with (
+            patch.object(ai_service, "HEDGE_DELAY_MS", 1),
+            patch.object(ai_service, "_call_openai", slow_openai),
+            patch.object(ai_service, "_call_ollama", fast_ollama),
+            patch.object(ai_service.openai_breaker._state, "state", ai_service.CircuitState.HALF_OPEN),
+        ):
+            result = await ai_service._call_hedged(object(), "model", None, messages=[])
+            await asyncio.wait_for(finished.wait(), timeout=1)
+
+        assert result == "ollama"
@@ -0,0 +1,72 @@
+"""
+Tests for async TTL memoization.
+"""
+
+import asyncio
+
+import pytest
+
+from app.utils.async_cache import async_ttl_cache
+
+
+class TestAsyncTTLCache:
+    @pytest.mark.asyncio
+    async def test_caches_by_arguments(self):
+        calls = []
+
+        @async_ttl_cache(ttl=60)
+        async def fetch(name: str) -> str:
+            calls.append(name)
+            return name.upper()
+
+        assert await fetch("a") == "A"
+        assert await fetch("a") == "A"
+        assert await fetch("b") == "B"
+        assert calls == ["a", "b"]
+
+    @pytest.mark.asyncio
+    async def test_concurrent_calls_coalesced(self):
+        calls = 0
+
+        @async_ttl_cache(ttl=60)
+        async def fetch(name: str) -> str:
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            return name
+
+        results = await asyncio.gather(*(fetch("a") for _ in range(10)))
+        assert results == ["a"] * 10
+        assert calls == 1
+
+    @pytest.mark.asyncio
+    async def test_exceptions_not_cached(self):
+        calls = 0
+
+        @async_ttl_cache(ttl=60)
+        async def fetch() -> int:
+            nonlocal calls
+            calls += 1
+            if calls == 1:
+                raise ConnectionError("down")
+            return calls
+
+        with pytest.raises(ConnectionError):
+            await fetch()
+        assert await fetch() == 2
+
+    @pytest.mark.asyncio
+    async def test_key_extra_change_invalidates(self):
+        state = {"value": "closed"}
+        calls = 0
+
+        @async_ttl_cache(ttl=60, key_extra=lambda: state["value"])
+        async def fetch() -> int:
+            nonlocal calls
+            calls += 1
+            return calls
+
+        assert await fetch() == 1
+        assert await fetch() == 1
+        state["value"] = "half_open"
+        assert await fetch() == 2
@@ -70,3 +70,56 @@ class TestGenerateCacheKey:
         key = generate_cache_key("prefix", "данные на русском")
         assert isinstance(key, str)
         assert len(key) > 0
+
+
+class _FakeRedis:
+    """Minimal async Redis stand-in for memoization tests."""
+
+    def __init__(self):
+        self.store = {}
+
+    async def get(self, key):
+        return self.store.get(key)
+
+    async def setex(self, key, ttl, value):
+        self.store[key] = value
+
+
+class TestRedisMemoize:
+    """Tests for the redis_memoize decorator."""
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_second_call_is_served_from_cache(self, monkeypatch):
+        """Wrapped function should run once within the TTL."""
+        from app.services import cache_service
+
+        fake = _FakeRedis()
+        monkeypatch.setattr(cache_service, "_get_redis", lambda: fake)
+        calls = []
+
+        @cache_service.redis_memoize(ttl=5, key_prefix="test")
+        async def status():
+            calls.append(1)
+            return {"status": "ok"}
+
+        first = await status()
+        second = await status()
+
+        assert len(calls) == 1
+        assert first.body == second.body == b'{"status":"ok"}'
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_works_without_redis(self, monkeypatch):
+        """Without Redis the function is called directly."""
+        from app.services import cache_service
+
+        monkeypatch.setattr(cache_service, "_get_redis", lambda: None)
+
+        @cache_service.redis_memoize(ttl=5, key_prefix="test")
+        async def status():
+            return {"status": "ok"}
+
+        response = await status()
+        assert response.body == b'{"status":"ok"}'
@@ -341,3 +341,77 @@ class TestCircuitBreakerConfig:
         # Record non-excluded exception
         await breaker._record_failure(TypeError("not excluded"))
         assert breaker._state.failure_count == 1
+
+
+class TestCircuitBreakerRecovery:
+    """Tests for half-open gating, probes and backoff."""
+
+    @pytest.fixture
+    def breaker(self):
+        name = f"recovery_test_{time.time()}"
+        return CircuitBreaker(name, CircuitBreakerConfig(failure_threshold=1, timeout=0.1, success_threshold=1))
+
+    async def _open(self, breaker):
+        with pytest.raises(ConnectionError):
+            await breaker.call(AsyncMock(side_effect=ConnectionError("down")))
+        assert breaker.state == CircuitState.OPEN
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_half_open_allows_single_trial(self, breaker):
+        """Only one request should pass while the half-open trial is in flight."""
+        await self._open(breaker)
+        await asyncio.sleep(0.15)
+
+        assert await breaker._check_state() is True
+        assert breaker.state == CircuitState.HALF_OPEN
+        assert await breaker._check_state() is False
+
+        await breaker._record_success()
+        assert breaker.state == CircuitState.CLOSED
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_successful_probe_closes_circuit(self, breaker):
+        """A passing probe should close the circuit before the request runs."""
+        probe = AsyncMock(return_value=None)
+        breaker.set_probe(probe)
+        await self._open(breaker)
+        await asyncio.sleep(0.15)
+
+        result = await breaker.call(AsyncMock(return_value="ok"))
+
+        assert result == "ok"
+        probe.assert_awaited_once()
+        assert breaker.state == CircuitState.CLOSED
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_failed_probe_reopens_with_backoff(self, breaker):
+        """A failing probe should reject the request and double the open timeout."""
+        operation = AsyncMock(return_value="ok")
+        breaker.set_probe(AsyncMock(side_effect=ConnectionError("still down")))
+        await self._open(breaker)
+        await asyncio.sleep(0.15)
+
+        with pytest.raises(CircuitBreakerOpenError):
+            await breaker.call(operation)
+
+        operation.assert_not_awaited()
+        assert breaker.state == CircuitState.OPEN
+        assert breaker.open_timeout == pytest.approx(0.2)
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_cancelled_trial_frees_slot(self, breaker):
+        """Cancelling the trial request must not leave the breaker stuck in HALF_OPEN."""
+        await self._open(breaker)
+        await asyncio.sleep(0.15)
+
+        task = asyncio.create_task(breaker.call(asyncio.sleep, 10))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+        assert await breaker._check_state() is True
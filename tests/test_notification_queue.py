@@ -0,0 +1,41 @@
+"""
+Tests for the background Telegram notification queue.
+"""
+
+import asyncio
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from app.services import notification_queue
+
+
+class TestNotificationQueue:
+    @pytest.mark.asyncio
+    async def test_stop_sends_batch_taken_by_flusher(self):
+        """A batch the flusher is still collecting should be sent on shutdown, not dropped."""
+        send = AsyncMock()
+
+        with patch.object(notification_queue.telegram_service, "send_message", send):
+            notification_queue.start_flusher()
+            notification_queue.enqueue_message("first")
+            await asyncio.sleep(0)  # flusher takes the message and waits for more
+            await notification_queue.stop_flusher()
+
+        send.assert_awaited_once_with("first")
+
+    @pytest.mark.asyncio
+    async def test_restart_keeps_pending_messages(self):
+        """Messages left in the previous queue should move to the new one."""
+        send = AsyncMock()
+
+        with patch.object(notification_queue.telegram_service, "send_message", send):
+            notification_queue.start_flusher()
+            notification_queue.enqueue_message("pending")
+            notification_queue._flusher_task.cancel()
+            await asyncio.sleep(0)
+
+            notification_queue.start_flusher()
+            await notification_queue.stop_flusher()
+
+        send.assert_awaited_once_with("pending")
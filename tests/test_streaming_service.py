@@ -0,0 +1,115 @@
+"""
+Unit tests for Streaming Service log decoding.
+"""
+
+import json
+
+import pytest
+
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.streaming_service import LogEntry, decode_log_batch
+
+
+class TestDecodeLogBatch:
+    """Tests for decode_log_batch."""
+
+    @pytest.mark.unit
+    def test_decode_single_filebeat_document(self):
+        """Nested ECS fields should be extracted from a single document."""
+        body = json.dumps(
+            {
+                "@timestamp": "2024-12-16T10:00:00Z",
+                "service": {"name": "api-gateway"},
+                "log": {"level": "error"},
+                "message": "Connection refused",
+                "source": "/var/log/app.log",
+                "kubernetes": {"pod": {"name": "api-1"}},
+            }
+        ).encode()
+
+        logs = decode_log_batch(body)
+
+        assert len(logs) == 1
+        assert logs[0].timestamp == "2024-12-16T10:00:00Z"
+        assert logs[0].service == "api-gateway"
+        assert logs[0].level == "error"
+        assert logs[0].message == "Connection refused"
+        assert logs[0].source == "/var/log/app.log"
+
+    @pytest.mark.unit
+    def test_decode_batch_with_flat_fields(self):
+        """Flat fields and defaults should be used when nested fields are missing."""
+        body = b'[{"timestamp": "t1", "service": "worker", "level": "warning"}, {"message": "hello"}]'
+
+        logs = decode_log_batch(body)
+
+        assert [log.service for log in logs] == ["worker", "unknown"]
+        assert [log.level for log in logs] == ["warning", "info"]
+        assert logs[0].timestamp == "t1"
+        assert logs[1].message == "hello"
+
+    @pytest.mark.unit
+    def test_raw_document_kept_as_metadata(self):
+        """The original document should round-trip through the stream format."""
+        document = {"message": "m", "extra": {"nested": [1, 2, 3]}}
+        body = json.dumps([document]).encode()
+
+        entry = decode_log_batch(body)[0]
+        restored = LogEntry.from_dict(entry.to_dict())
+
+        assert restored.metadata == document
+
+    @pytest.mark.unit
+    def test_ecs_source_object_and_null_message(self):
+        """Non-string ECS field values should be accepted and converted to strings."""
+        body = json.dumps(
+            [
+                {"@timestamp": 1734343200, "message": None, "source": {"ip": "10.0.0.1", "port": 5044}},
+                {"message": "ok"},
+            ]
+        ).encode()
+
+        logs = decode_log_batch(body)
+
+        assert len(logs) == 2
+        assert logs[0].timestamp == "1734343200"
+        assert logs[0].message == ""
+        assert json.loads(logs[0].source) == {"ip": "10.0.0.1", "port": 5044}
+        assert logs[1].timestamp == ""
+        assert logs[1].source == ""
+
+    @pytest.mark.unit
+    def test_invalid_json_raises(self):
+        """Malformed bodies should raise an error."""
+        with pytest.raises(ValueError):
+            decode_log_batch(b"{not json")
+
+
+class TestBufferLogs:
+    """Tests for StreamingService.buffer_logs."""
+
+    @pytest.mark.unit
+    @pytest.mark.asyncio
+    async def test_full_batch_is_published_once(self, monkeypatch):
+        """A batch that fills the buffer should be flushed in a single publish."""
+        from app.services.streaming_service import StreamingService
+
+        service = StreamingService()
+        batches = []
+
+        async def fake_publish_batch(logs):
+            batches.append(list(logs))
+            return len(logs)
+
+        monkeypatch.setattr(service, "publish_batch", fake_publish_batch)
+        logs = [LogEntry(timestamp="t", service="api", level="info", message=str(i)) for i in range(250)]
+
+        await service.buffer_logs(logs)
+
+        assert len(batches) == 1
+        assert len(batches[0]) == 250
+        assert service._buffer == []